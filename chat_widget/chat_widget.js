@@ -146,19 +146,46 @@ class ChatWidget {
         // Show typing indicator
         this.showTypingIndicator();
         
+        let botMessage = null;
+        let streamedText = '';
+        
         try {
-            // Send message to API
-            const response = await this.callChatAPI(message);
+            let response;
+            try {
+                // Stream the answer and render tokens as they arrive
+                response = await this.callChatStreamAPI(message, (event) => {
+                    if (event.type === 'token') {
+                        if (!botMessage) {
+                            this.hideTypingIndicator();
+                            botMessage = this.addMessage('', 'bot', {
+                                messageId: Date.now() // Use timestamp as simple message ID
+                            });
+                        }
+                        streamedText += event.text;
+                        this.updateMessageText(botMessage, streamedText);
+                    }
+                });
+            } catch (streamError) {
+                // Nothing rendered yet: fall back to the non-streaming endpoint,
+                // unless the service is shedding load
+                if (botMessage || streamError.retryAfter) throw streamError;
+                console.warn('Chat stream unavailable, falling back:', streamError);
+                response = await this.callChatAPI(message);
+            }
             
             // Hide typing indicator
             this.hideTypingIndicator();
             
-            // Add bot response
-            this.addMessage(response.response, 'bot', {
-                confidence: response.confidence,
-                category: response.category,
-                messageId: Date.now() // Use timestamp as simple message ID
-            });
+            // Add bot response, or complete the streamed one
+            if (botMessage) {
+                this.updateMessageText(botMessage, response.response);
+            } else {
+                this.addMessage(response.response, 'bot', {
+                    confidence: response.confidence,
+                    category: response.category,
+                    messageId: Date.now() // Use timestamp as simple message ID
+                });
+            }
             
             // Show feedback modal if confidence is low or after delay
             if (response.confidence < 0.7) {
@@ -170,10 +197,16 @@ class ChatWidget {
         } catch (error) {
             console.error('Chat API error:', error);
             this.hideTypingIndicator();
+            if (botMessage) botMessage.remove();
             
-            const errorMessage = this.currentLanguage === 'ar' 
+            let errorMessage = this.currentLanguage === 'ar' 
                 ? 'عذراً، حدث خطأ. يرجى المحاولة مرة أخرى.'
                 : 'Sorry, there was an error. Please try again.';
+            if (error.retryAfter) {
+                errorMessage = this.currentLanguage === 'ar'
+                    ? `نتلقى الكثير من الطلبات حالياً. يرجى المحاولة مرة أخرى بعد ${error.retryAfter} ثانية.`
+                    : `We are receiving a lot of requests right now. Please try again in ${error.retryAfter} seconds.`;
+            }
                 
             this.addMessage(errorMessage, 'bot', { isError: true });
         } finally {
@@ -195,6 +228,7 @@ class ChatWidget {
             })
         });
         
+        this.checkOverloaded(response);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -202,6 +236,75 @@ class ChatWidget {
         return await response.json();
     }
     
+    checkOverloaded(response) {
+        // 429: the service is at capacity and says when to retry
+        if (response.status === 429) {
+            const error = new Error('Service overloaded');
+            error.retryAfter = response.headers.get('Retry-After') || '5';
+            throw error;
+        }
+    }
+    
+    async callChatStreamAPI(message, onEvent) {
+        const response = await fetch(`${this.apiEndpoint}/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({
+                message: message,
+                language: this.currentLanguage,
+                session_id: this.sessionId,
+                user_id: this.userId
+            })
+        });
+        
+        this.checkOverloaded(response);
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        // Parse Server-Sent Events: frames are separated by a blank line
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let done = null;
+        
+        while (true) {
+            const { value, done: finished } = await reader.read();
+            if (finished) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                const data = frame.split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim())
+                    .join('\n');
+                if (!data) continue;
+                
+                const event = JSON.parse(data);
+                onEvent(event);
+                if (event.type === 'done') done = event;
+            }
+        }
+        
+        if (!done) {
+            throw new Error('Chat stream ended early');
+        }
+        return done;
+    }
+    
+    updateMessageText(messageDiv, text) {
+        messageDiv.querySelector('.message-text').innerHTML = this.formatMessage(text);
+        const messagesContainer = document.getElementById('chat-messages');
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+    
     addMessage(text, sender, metadata = {}) {
         const messagesContainer = document.getElementById('chat-messages');
         const messageDiv = document.createElement('div');
@@ -248,6 +351,8 @@ class ChatWidget {
         if (!this.isOpen) {
             this.showNotificationBadge();
         }
+        
+        return messageDiv;
     }
     
     formatMessage(text) {
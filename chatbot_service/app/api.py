@@ -1,67 +1,143 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import aclosing
 from typing import List, Optional
 import json
+import os
 from datetime import datetime
 
-from .models import ChatRequest, ChatResponse, FeedbackRequest
+from .models import ChatRequest, ChatResponse, FeedbackRequest, FAQUpdateRequest
 from langgraph_agents.agent import ChatbotAgent
+from langgraph_agents.query_classifier import CATEGORIES
 from utils.language_detector import LanguageDetector
+from utils.embeddings import get_embedding_generator
+from utils.document_processor import DocumentProcessor
+from utils.executors import run_io
+from utils.llm_limiter import LLMOverloadedError
+from utils.metrics import Trace, registry
+from vector_store.factory import get_vector_store
 router = APIRouter()
 
 # Initialize components
-chatbot_agent = ChatbotAgent()
 language_detector = LanguageDetector()
+_chatbot_agent: Optional[ChatbotAgent] = None
+
+def get_chatbot_agent() -> ChatbotAgent:
+    """Get the process-wide chatbot agent, created on first use.
+
+    Importing this module must stay free of side effects: spawned CPU pool
+    workers re-import the entry module, and would otherwise each build an
+    agent with its own vector store.
+    """
+    global _chatbot_agent
+    if _chatbot_agent is None:
+        _chatbot_agent = ChatbotAgent()
+    return _chatbot_agent
+
+# Request and stage latency; labels are limited to known values so the series count stays bounded
+request_seconds = registry.histogram(
+    "chatbot_request_duration_seconds",
+    "Time to answer a chat request, by endpoint and how it was answered",
+    ["endpoint", "source", "category", "language"]
+)
+stage_seconds = registry.histogram(
+    "chatbot_stage_duration_seconds",
+    "Time spent in each chat processing stage",
+    ["stage", "category", "language"]
+)
+rejected_chats = registry.counter(
+    "chatbot_rejected_requests_total",
+    "Chat requests answered with 429 because the LLM queue was full",
+    ["endpoint"]
+)
+registry.gauge("chatbot_llm_queue_depth", "Callers waiting for an LLM slot", function=lambda: get_chatbot_agent().llm_limiter.waiting)
+registry.gauge("chatbot_llm_active_calls", "LLM calls in flight", function=lambda: get_chatbot_agent().llm_limiter.active)
+registry.gauge("chatbot_llm_circuit_open", "1 while the LLM circuit breaker is open", function=lambda: int(get_chatbot_agent().circuit_breaker.is_open()))
+registry.counter("chatbot_response_cache_hits_total", "Response cache hits", function=lambda: get_chatbot_agent().response_cache.hits)
+registry.counter("chatbot_response_cache_misses_total", "Response cache misses", function=lambda: get_chatbot_agent().response_cache.misses)
+registry.counter("chatbot_faq_hits_total", "Chats answered from the FAQ index", function=lambda: get_chatbot_agent().faq_index.exact_hits + get_chatbot_agent().faq_index.vector_hits)
+
+def observe_chat(trace: Trace, endpoint: str, language: str, response: dict) -> None:
+    """Feed a finished chat's total and per-stage durations into the latency histograms"""
+    category = response["category"] if response["category"] in CATEGORIES else "unknown"
+    language = language if language in ("en", "ar") else "other"
+    request_seconds.observe(trace.elapsed(), endpoint=endpoint, source=response.get("source", "unknown"), category=category, language=language)
+    for stage, seconds in trace.durations.items():
+        stage_seconds.observe(seconds, stage=stage, category=category, language=language)
 
 # Simple in-memory storage for chat logs
 chat_logs_storage = []
 support_queue_storage = []
 
+# Progress of the latest full reindex (blue/green rebuild)
+reindex_state = {
+    "status": "idle",
+    "target_generation": None,
+    "files_total": 0,
+    "files_done": 0,
+    "chunks_indexed": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None
+}
+
+def record_chat(request: ChatRequest, language: str, response: dict, response_time: Optional[float] = None) -> dict:
+    """Store the chat log and queue unresolved chats for human support"""
+    chat_log = {
+        "user_id": request.user_id,
+        "session_id": request.session_id,
+        "message": request.message,
+        "response": response["response"],
+        "language": language,
+        "category": response["category"],
+        "confidence": response["confidence"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "resolved": response["confidence"] > 0.5,
+        "response_time": response_time
+    }
+    
+    chat_logs_storage.append(chat_log)
+    
+    # Add to support queue if unresolved
+    if not chat_log["resolved"]:
+        support_queue_storage.append({
+            "chat_id": f"{request.session_id}_{len(chat_logs_storage)}",
+            "user_id": request.user_id,
+            "session_id": request.session_id,
+            "message": request.message,
+            "response": response["response"],
+            "category": response["category"],
+            "confidence": response["confidence"],
+            "timestamp": datetime.utcnow().isoformat(),
+            "status": "pending"
+        })
+    
+    return chat_log
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     """Main chat endpoint that processes user messages"""
+    chatbot_agent = get_chatbot_agent()
+    trace = Trace()
     try:
-        # Detect language
-        detected_language = language_detector.detect_language(request.message)
-        
-        # Use specified language if provided, otherwise use detected
-        language = request.language or detected_language
+        # Use specified language if provided, otherwise detect it
+        language = request.language
+        if not language:
+            with trace.span("language_detection"):
+                language = language_detector.detect_language(request.message)
         
         # Process chat with agent
         response = await chatbot_agent.process_chat(
             message=request.message,
             language=language,
             user_id=request.user_id,
-            session_id=request.session_id
+            session_id=request.session_id,
+            trace=trace
         )
         
-        # Store chat log
-        chat_log = {
-            "user_id": request.user_id,
-            "session_id": request.session_id,
-            "message": request.message,
-            "response": response["response"],
-            "language": language,
-            "category": response["category"],
-            "confidence": response["confidence"],
-            "timestamp": datetime.utcnow().isoformat(),
-            "resolved": response["confidence"] > 0.5
-        }
-        
-        chat_logs_storage.append(chat_log)
-        
-        # Add to support queue if unresolved
-        if not chat_log["resolved"]:
-            support_queue_storage.append({
-                "chat_id": f"{request.session_id}_{len(chat_logs_storage)}",
-                "user_id": request.user_id,
-                "session_id": request.session_id,
-                "message": request.message,
-                "response": response["response"],
-                "category": response["category"],
-                "confidence": response["confidence"],
-                "timestamp": datetime.utcnow().isoformat(),
-                "status": "pending"
-            })
+        with trace.span("logging"):
+            chat_log = record_chat(request, language, response, response_time=trace.elapsed())
+        observe_chat(trace, "chat", language, response)
         
         return ChatResponse(
             response=response["response"],
@@ -71,9 +147,66 @@ async def chat_endpoint(request: ChatRequest):
             resolved=chat_log["resolved"]
         )
         
+    except LLMOverloadedError as e:
+        rejected_chats.inc(endpoint="chat")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Stream the answer as Server-Sent Events: metadata, then tokens, then done"""
+    chatbot_agent = get_chatbot_agent()
+    trace = Trace()
+    language = request.language
+    if not language:
+        with trace.span("language_detection"):
+            language = language_detector.detect_language(request.message)
+    
+    stream = chatbot_agent.stream_chat(
+        message=request.message,
+        language=language,
+        user_id=request.user_id,
+        session_id=request.session_id,
+        trace=trace
+    )
+    
+    # Overload is only raised before the first event, while a 429 can still be sent
+    try:
+        first_event = await anext(stream)
+    except LLMOverloadedError as e:
+        rejected_chats.inc(endpoint="chat_stream")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    def to_sse(event: dict) -> str:
+        if event['type'] == 'done':
+            # Log once the full answer is known
+            with trace.span("logging"):
+                chat_log = record_chat(request, language, event, response_time=trace.elapsed())
+            observe_chat(trace, "chat_stream", language, event)
+            event = {
+                'type': 'done',
+                'response': event['response'],
+                'confidence': event['confidence'],
+                'category': event['category'],
+                'language': language,
+                'resolved': chat_log['resolved']
+            }
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    async def events():
+        # Closing the response closes the agent's stream too, releasing its LLM slot
+        async with aclosing(stream):
+            yield to_sse(first_event)
+            async for event in stream:
+                yield to_sse(event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/feedback")
 async def submit_feedback(feedback: FeedbackRequest):
     """Submit feedback for a chat response"""
@@ -111,33 +244,163 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "chatbot"}
 
+@router.get("/stats")
+async def service_stats():
+    """Runtime statistics for tuning the chatbot service"""
+    chatbot_agent = get_chatbot_agent()
+    return {
+        "language_detection": language_detector.get_stats(),
+        "embedding_batching": get_embedding_generator().get_batching_stats(),
+        "embedding_cache": get_embedding_generator().get_cache_stats(),
+        "chat_pipeline": chatbot_agent.get_pipeline_stats(),
+        "query_classifier": chatbot_agent.get_classifier_stats(),
+        "response_cache": chatbot_agent.get_response_cache_stats(),
+        "retrieval": chatbot_agent.get_retrieval_stats(),
+        "lexical_index": get_vector_store().get_lexical_stats(),
+        "context_packing": chatbot_agent.get_context_stats(),
+        "faq": chatbot_agent.faq_index.get_stats(),
+        "single_flight": chatbot_agent.get_single_flight_stats(),
+        "llm_limiter": chatbot_agent.get_llm_limiter_stats(),
+        "llm_resilience": chatbot_agent.get_resilience_stats()
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms and counters in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.post("/train-classifier")
+async def train_classifier():
+    """Train the local query classifier on the stored chat logs"""
+    chatbot_agent = get_chatbot_agent()
+    used = chatbot_agent.train_classifier_from_chat_logs(chat_logs_storage)
+    return {"status": "success", "examples_added": used, "classifier": chatbot_agent.get_classifier_stats()}
+
+@router.get("/faq")
+async def list_faq():
+    """List the curated FAQ entries answered without the LLM"""
+    chatbot_agent = get_chatbot_agent()
+    return {"entries": list(chatbot_agent.faq_index.entries.values()), "stats": chatbot_agent.faq_index.get_stats()}
+
+@router.post("/faq")
+async def update_faq(request: FAQUpdateRequest):
+    """Add or replace FAQ entries and save them to the FAQ file"""
+    chatbot_agent = get_chatbot_agent()
+    entries = [entry.model_dump() for entry in request.entries]
+    try:
+        if request.replace:
+            await chatbot_agent.faq_index.set_entries(entries)
+            ids = list(chatbot_agent.faq_index.entries)
+        else:
+            ids = await chatbot_agent.faq_index.add_entries(entries)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await chatbot_agent.faq_index.save_file()
+    return {"status": "success", "ids": ids, "entries": len(chatbot_agent.faq_index.entries)}
+
+@router.delete("/faq/{entry_id}")
+async def delete_faq_entry(entry_id: str):
+    """Remove an FAQ entry and save the FAQ file"""
+    chatbot_agent = get_chatbot_agent()
+    if not await chatbot_agent.faq_index.remove_entry(entry_id):
+        raise HTTPException(status_code=404, detail=f"FAQ entry {entry_id} not found")
+    
+    await chatbot_agent.faq_index.save_file()
+    return {"status": "success", "entries": len(chatbot_agent.faq_index.entries)}
+
+@router.post("/faq/reload")
+async def reload_faq():
+    """Reload the FAQ entries from the FAQ file"""
+    chatbot_agent = get_chatbot_agent()
+    count = await chatbot_agent.faq_index.load_file()
+    return {"status": "success", "entries": count}
+
 @router.post("/reindex-documents")
-async def reindex_documents(background_tasks: BackgroundTasks):
-    """Manually trigger document reindexing"""
+async def reindex_documents(background_tasks: BackgroundTasks, filename: Optional[str] = None):
+    """Manually trigger document reindexing, optionally for a single file in the input folder"""
+    # A single-file update written to the live generation while a full rebuild runs
+    # would be lost when the rebuilt generation replaces it
+    if reindex_state["status"] in ("building", "swapping"):
+        raise HTTPException(status_code=409, detail="A full reindex is in progress")
+    if filename:
+        file_path = os.path.join("input", os.path.basename(filename))
+        if not os.path.isfile(file_path):
+            raise HTTPException(status_code=404, detail=f"Document {filename} not found")
+    
     try:
-        from utils.document_processor import DocumentProcessor
-        from vector_store.chroma_store import ChromaStore
+        if filename:
+            background_tasks.add_task(reindex_document_task, file_path)
+            return {"status": "success", "message": f"Reindexing of {os.path.basename(filename)} started"}
         
+        reindex_state.update({
+            "status": "building",
+            "target_generation": None,
+            "files_total": 0,
+            "files_done": 0,
+            "chunks_indexed": 0,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "error": None
+        })
         background_tasks.add_task(reindex_documents_task)
         return {"status": "success", "message": "Document reindexing started"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Reindexing failed: {str(e)}")
 
+@router.get("/index-status")
+async def index_status():
+    """Active index generation and progress of the latest rebuild"""
+    return {
+        "active": await run_io(get_vector_store().get_collection_info),
+        "reindex": reindex_state
+    }
+
 async def reindex_documents_task():
-    """Background task for document reindexing"""
+    """Background task that rebuilds the index in a shadow collection and swaps it in.
+    
+    Chat traffic keeps reading the active generation until the alias is switched.
+    """
+    processed_docs_file = "processed_documents.json"
     try:
-        vector_store = ChromaStore()
-        doc_processor = DocumentProcessor()
+        vector_store = get_vector_store()
+        shadow_store = await run_io(vector_store.create_generation)
+        reindex_state["target_generation"] = shadow_store.generation
         
-        # Clear existing documents
-        vector_store.clear_collection()
+        # The shadow build keeps its own ledger until it goes live
+        shadow_docs_file = f"{processed_docs_file}.g{shadow_store.generation}"
+        if os.path.exists(shadow_docs_file):
+            os.remove(shadow_docs_file)
+        doc_processor = DocumentProcessor(processed_docs_file=shadow_docs_file)
         
-        # Reprocess all documents
         input_folder = "input"
         if os.path.exists(input_folder):
-            await doc_processor.process_folder(input_folder, vector_store)
-            print("Document reindexing completed successfully")
+            await doc_processor.process_folder(input_folder, shadow_store, force=True, progress=reindex_state)
+        await run_io(doc_processor._save_processed_docs)
+        
+        await run_io(os.replace, shadow_docs_file, processed_docs_file)
+        reindex_state["status"] = "swapping"
+        await vector_store.activate_generation(shadow_store)
+        
+        # The FAQ file lives in the input folder too
+        await get_chatbot_agent().faq_index.load_file()
+        
+        reindex_state.update({"status": "completed", "finished_at": datetime.utcnow().isoformat()})
+        print("Document reindexing completed successfully")
         
     except Exception as e:
+        reindex_state.update({"status": "failed", "finished_at": datetime.utcnow().isoformat(), "error": str(e)})
         print(f"Document reindexing failed: {e}")
+
+async def reindex_document_task(file_path: str):
+    """Background task that re-ingests one file, touching only that file's vectors"""
+    try:
+        vector_store = get_vector_store()
+        doc_processor = DocumentProcessor()
+        
+        await doc_processor.process_document(file_path, vector_store, force=True)
+        print(f"Reindexing of {file_path} completed successfully")
+        
+    except Exception as e:
+        print(f"Reindexing of {file_path} failed: {e}")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class ChatRequest(BaseModel):
@@ -26,3 +26,14 @@ class DocumentMetadata(BaseModel):
     file_size: int
     indexed_at: datetime
     chunk_count: int
+
+class FAQEntry(BaseModel):
+    question: str
+    answer: str
+    language: str = "en"
+    category: str = "Product FAQ"
+    alternatives: List[str] = []  # other phrasings of the same question
+
+class FAQUpdateRequest(BaseModel):
+    entries: List[FAQEntry]
+    replace: bool = False  # replace the whole FAQ instead of adding to it
@@ -1,33 +1,200 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from contextlib import aclosing
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Any, List, Optional
 from datetime import datetime
 import os
+import time
 
+import httpx
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
 
-from vector_store.chroma_store import ChromaStore
+from vector_store.base import VectorStore
+from vector_store.factory import get_vector_store
+from vector_store.faq_index import FAQIndex
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.hedging import Hedger
 from utils.language_detector import LanguageDetector
+from utils.llm_limiter import LLMLimiter, LLMOverloadedError
+from utils.metrics import Trace, registry, span
+from utils.response_cache import SemanticResponseCache
+from utils.single_flight import SingleFlight
+from utils.tokenizer import estimate_tokens, normalize_text
+from langgraph_agents.context_assembler import ContextAssembler
+from langgraph_agents.pipeline import EarlyExit, Stage, StagePipeline
+from langgraph_agents.query_classifier import CATEGORIES, QueryClassifier
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# LLM calls made on behalf of the current chat request
+_request_llm_calls: ContextVar[Optional[List[int]]] = ContextVar("request_llm_calls", default=None)
+# Event-loop time by which the current chat request must be answered
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+_llm_call_seconds = registry.histogram(
+    "chatbot_llm_call_duration_seconds",
+    "Duration of Gemini calls by kind of call and outcome",
+    ["kind", "outcome"]
+)
+
 class QueryCategory(BaseModel):
     category: str
     confidence: float
 
+class CategorizedAnswer(BaseModel):
+    category: str
+    confidence: float
+    answer: str
+
 class ChatbotAgent:
-    def __init__(self):
+    def __init__(self, vector_store: Optional[VectorStore] = None):
+        # LLM settings; timeouts are per call, in seconds
+        self.llm_model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        self.categorize_timeout = float(os.getenv("LLM_CATEGORIZE_TIMEOUT", "10"))
+        self.generate_timeout = float(os.getenv("LLM_GENERATE_TIMEOUT", "30"))
+        max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        
+        # One pooled HTTP connection shared by every async Gemini call
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=self.generate_timeout
+        )
+        
+        # Concurrency, rate and wait-queue limits shared by every Gemini call
+        rate_limit = os.getenv("LLM_RATE_LIMIT")
+        self.llm_limiter = LLMLimiter(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", str(max_connections))),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+            rate=float(rate_limit) if rate_limit else 0.0,
+            burst=int(os.getenv("LLM_RATE_BURST", "10"))
+        )
+        
+        # Every chat request is answered within this many seconds; LLM timeouts are capped to what is left
+        self.request_deadline = float(os.getenv("CHAT_REQUEST_DEADLINE", "25"))
+        self.deadline_exceeded = 0
+        
+        # Calls slower than the recent p95 get a hedged duplicate, when enabled
+        self.hedger = Hedger(
+            quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            min_delay_ms=float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "50"))
+        ) if os.getenv("LLM_HEDGING", "false").lower() == "true" else None
+        
+        # A spike in Gemini errors switches chats to the FAQ and support hand-off until it recovers
+        self.circuit_breaker = CircuitBreaker(
+            failure_rate=float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5")),
+            window=int(os.getenv("LLM_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+            open_seconds=float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+        )
+        self.faq_fallback_threshold = float(os.getenv("FAQ_FALLBACK_THRESHOLD", "0.8"))
+        self.degraded_responses = 0
+        
         # Initialize Gemini client
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        self.client = genai.Client(
+            api_key=os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(
+                base_url=os.getenv("GEMINI_BASE_URL") or None,
+                httpx_async_client=self.http_client
+            )
+        )
         
         # Initialize components
-        self.vector_store = ChromaStore()
+        self.vector_store = vector_store or get_vector_store()
         self.language_detector = LanguageDetector()
         
+        # Local category classifier; the LLM is only asked when it is not confident.
+        # A threshold above 1 sends every query to the LLM.
+        self.query_classifier = QueryClassifier()
+        self.local_classifier_threshold = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+        self.categorization_counts = {'local': 0, 'llm': 0}
+        
+        # Curated FAQ answers, checked before the response cache and the RAG pipeline
+        self.faq_index = FAQIndex(
+            self.vector_store.embedding_generator,
+            threshold=float(os.getenv("FAQ_MATCH_THRESHOLD", "0.92"))
+        )
+        
+        # Retrieved chunks are deduplicated and packed into this many prompt tokens
+        self.context_assembler = ContextAssembler(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")))
+        
+        # Without a chunk this close (Chroma distance), the query goes to human
+        # support without an LLM call. Unset only skips when nothing was retrieved,
+        # since the distance scale depends on the embedding backend.
+        max_distance = os.getenv("RETRIEVAL_MAX_DISTANCE")
+        self.retrieval_max_distance = float(max_distance) if max_distance else None
+        
+        # Retrieval searches chunks in the query language first and fills up from
+        # all languages when fewer than this many come back (0 searches all languages)
+        self.language_min_results = int(os.getenv("RETRIEVAL_LANGUAGE_MIN_RESULTS", "2"))
+        self.retrieval_counts = {'language_filtered': 0, 'cross_language_fallback': 0, 'unfiltered': 0}
+        
+        # Answers to near-duplicate questions, dropped when the index changes
+        self.response_cache = SemanticResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+            threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        )
+        
+        # Identical questions asked concurrently share one pipeline run
+        self.chat_single_flight = SingleFlight()
+        
+        # Agent mode: "two_call" categorizes and answers with separate LLM calls,
+        # "combined" asks for category and answer in one structured response
+        self.agent_mode = os.getenv("AGENT_MODE", "two_call").lower()
+        if self.agent_mode not in ('two_call', 'combined'):
+            logger.warning(f"Unknown AGENT_MODE {self.agent_mode}, using two_call")
+            self.agent_mode = 'two_call'
+        self.combined_counts = {'calls': 0, 'fallbacks': 0}
+        
+        if self.agent_mode == 'combined':
+            # Retrieval first, then one call for category and answer
+            self.pipeline = StagePipeline([
+                Stage('retrieve', self._retrieve_stage),
+                Stage(
+                    'categorize_and_generate',
+                    lambda state: self._categorize_and_generate(state['message'], state['retrieve'], state['language']),
+                    depends_on=('retrieve',)
+                )
+            ])
+        else:
+            # Categorization and retrieval are independent and run concurrently;
+            # generation waits for both
+            self.pipeline = StagePipeline([
+                Stage('categorize', lambda state: self._categorize_query(state['message'], state['language'])),
+                Stage('retrieve', self._retrieve_stage),
+                Stage(
+                    'generate',
+                    lambda state: self._generate_response(
+                        state['message'], state['retrieve'], state['language'], state['categorize']['category']
+                    ),
+                    depends_on=('categorize', 'retrieve')
+                )
+            ])
+        
+        # Streaming runs categorization and retrieval, then streams the answer itself.
+        # Combined mode's single JSON response cannot be shown token by token.
+        self.stream_pipeline = StagePipeline([
+            Stage('categorize', lambda state: self._categorize_query(state['message'], state['language'])),
+            Stage('retrieve', lambda state: self._retrieve_stage(state, pack=False))
+        ])
+        
+        # Appended to the answer prompt in combined mode
+        self.combined_instructions = """
+            Also classify the customer query into exactly one of these categories:
+            - Product FAQ: Questions about product features, specifications, usage
+            - Tech issue: Technical problems, bugs, troubleshooting
+            - Transactional: Orders, payments, refunds, account issues
+            
+            Respond with JSON only: {"category": "category_name", "confidence": float_between_0_and_1, "answer": "your answer to the customer"}
+            """
+        
         # Category classification prompts
         self.category_prompt = {
             'en': """
@@ -36,7 +203,7 @@ class ChatbotAgent:
             - Tech issue: Technical problems, bugs, troubleshooting
             - Transactional: Orders, payments, refunds, account issues
             
-            Respond with JSON in this format: {"category": "category_name", "confidence": float_between_0_and_1}
+            Respond with JSON in this format: {{"category": "category_name", "confidence": float_between_0_and_1}}
             
             Query: {query}
             """,
@@ -46,54 +213,329 @@ class ChatbotAgent:
             - Tech issue: مشاكل تقنية وأخطاء واستكشاف الأخطاء وإصلاحها
             - Transactional: طلبات ومدفوعات واسترداد ومشاكل الحساب
             
-            أجب بصيغة JSON: {"category": "category_name", "confidence": float_between_0_and_1}
+            أجب بصيغة JSON: {{"category": "category_name", "confidence": float_between_0_and_1}}
             
             الاستفسار: {query}
             """
         }
 
-    async def process_chat(self, message: str, language: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
-        """Main chat processing pipeline using LangGraph-like approach"""
+    async def process_chat(self, message: str, language: str, user_id: Optional[str] = None, session_id: Optional[str] = None, trace: Optional[Trace] = None) -> Dict[str, Any]:
+        """Main chat processing pipeline using LangGraph-like approach.
+        
+        Identical questions in the same language that arrive while one is being
+        answered share that answer instead of running the pipeline again; stage
+        timings go to the trace of the request that ran it. The result's
+        'source' says how it was answered: faq, cache, degraded, no_context,
+        llm or error.
+        """
+        key = (" ".join(normalize_text(message).split()), language)
+        result = await self.chat_single_flight.do(key, lambda: self._process_chat(message, language, trace or Trace()))
+        return dict(result)
+
+    async def _process_chat(self, message: str, language: str, trace: Trace) -> Dict[str, Any]:
+        """Answer one question through the FAQ, response cache and stage pipeline"""
+        deadline = asyncio.get_running_loop().time() + self.request_deadline
         try:
-            # Step 1: Categorize query
-            category_result = await self._categorize_query(message, language)
+            # The query embedding keys the FAQ and response cache lookups and is reused for retrieval
+            with trace.span('embedding'):
+                query_embedding = await self._embed_query(message)
+            faq_answer = self._match_faq(message, language, query_embedding)
+            if faq_answer is not None:
+                return faq_answer
+            
+            index_version = self.vector_store.index_version
+            if query_embedding is not None:
+                cached = self.response_cache.get(query_embedding, language, index_version)
+                if cached is not None:
+                    return {**cached, 'language': language, 'cached': True, 'source': 'cache'}
             
-            # Step 2: Retrieve relevant context
-            context_chunks = await self._retrieve_context(message, language)
+            if self.circuit_breaker.is_open():
+                return self._degraded_response(message, language, query_embedding)
             
-            # Step 3: Generate response using Gemini
-            response_result = await self._generate_response(
-                message, context_chunks, language, category_result['category']
+            # Turn the request away now rather than queue it behind a full LLM wait queue
+            self.llm_limiter.admit()
+            llm_calls = [0]
+            state, timings = await self._run_pipeline(
+                self.pipeline, llm_calls, deadline, trace, message=message, language=language, query_embedding=query_embedding
             )
             
-            # Step 4: Calculate confidence score
+            if 'early_exit' in state:
+                # Nothing relevant was retrieved; the answer is the support hand-off
+                category_result = state.get('categorize') or self.query_classifier.classify(message)
+                response_result = state['retrieve']
+            elif self.agent_mode == 'combined':
+                category_result = state['categorize_and_generate']['category']
+                response_result = state['categorize_and_generate']['response']
+            else:
+                category_result = state['categorize']
+                response_result = state['generate']
+            logger.debug(f"Chat pipeline timings (ms): {timings}")
+            
+            # Calculate confidence score
             confidence = min(category_result['confidence'], response_result['confidence'])
             
-            return {
+            result = {
                 'response': response_result['response'],
                 'confidence': confidence,
                 'category': category_result['category'],
                 'language': language
             }
+            self._cache_response(query_embedding, index_version, result, llm_calls[0])
+            
+            source = 'no_context' if 'early_exit' in state else 'llm'
+            return {**result, 'source': source, 'timings': timings}
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Chat processing failed: {e}")
             return {
                 'response': self._get_fallback_response(language),
                 'confidence': 0.1,
                 'category': 'unknown',
+                'language': language,
+                'source': 'error'
+            }
+
+    async def stream_chat(self, message: str, language: str, user_id: Optional[str] = None, session_id: Optional[str] = None, trace: Optional[Trace] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming variant of process_chat.
+        
+        Yields a 'metadata' event with the category and retrieved sources, then
+        'token' events as the answer is generated, then a 'done' event holding
+        the same fields process_chat returns.
+        """
+        response_text = ""
+        trace = trace or Trace()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_deadline
+        try:
+            with trace.span('embedding'):
+                query_embedding = await self._embed_query(message)
+            faq_answer = self._match_faq(message, language, query_embedding)
+            if faq_answer is not None:
+                yield {'type': 'metadata', 'category': faq_answer['category'], 'category_confidence': faq_answer['confidence'], 'sources': ['faq'], 'cached': False}
+                yield {'type': 'token', 'text': faq_answer['response']}
+                yield {'type': 'done', **faq_answer}
+                return
+            
+            index_version = self.vector_store.index_version
+            cached = None
+            if query_embedding is not None:
+                cached = self.response_cache.get(query_embedding, language, index_version)
+            
+            if cached is not None:
+                yield {'type': 'metadata', 'category': cached['category'], 'category_confidence': cached['confidence'], 'sources': [], 'cached': True}
+                yield {'type': 'token', 'text': cached['response']}
+                yield {'type': 'done', **cached, 'language': language, 'cached': True, 'source': 'cache'}
+                return
+            
+            if self.circuit_breaker.is_open():
+                degraded = self._degraded_response(message, language, query_embedding)
+                yield {'type': 'metadata', 'category': degraded['category'], 'category_confidence': degraded['confidence'], 'sources': ['faq'] if 'faq_id' in degraded else [], 'cached': False}
+                yield {'type': 'token', 'text': degraded['response']}
+                yield {'type': 'done', **degraded}
+                return
+            
+            # Categorization and retrieval run concurrently before the answer streams
+            self.llm_limiter.admit()
+            llm_calls = [0]
+            state, timings = await self._run_pipeline(
+                self.stream_pipeline, llm_calls, deadline, trace, message=message, language=language, query_embedding=query_embedding
+            )
+            if 'early_exit' in state:
+                category_result = state.get('categorize') or self.query_classifier.classify(message)
+                yield {
+                    'type': 'metadata',
+                    'category': category_result['category'],
+                    'category_confidence': category_result['confidence'],
+                    'sources': [],
+                    'cached': False
+                }
+                yield {'type': 'token', 'text': state['retrieve']['response']}
+                yield {
+                    'type': 'done',
+                    'response': state['retrieve']['response'],
+                    'confidence': min(category_result['confidence'], state['retrieve']['confidence']),
+                    'category': category_result['category'],
+                    'language': language,
+                    'source': 'no_context',
+                    'timings': timings
+                }
+                return
+            
+            category_result = state['categorize']
+            # The trace is only active inside the pipeline, so stream-side stages are timed here
+            with trace.span('context_assembly'):
+                context_chunks = self._pack_context(state['retrieve'])
+            sources = list(dict.fromkeys(
+                result['metadata'].get('filename') for result in state['retrieve'] if result.get('metadata', {}).get('filename')
+            ))
+            yield {
+                'type': 'metadata',
+                'category': category_result['category'],
+                'category_confidence': category_result['confidence'],
+                'sources': sources,
+                'cached': False
+            }
+            
+            llm_calls[0] += 1
+            response_confidence = None
+            system_prompt, user_prompt = self._build_answer_prompts(message, context_chunks, language, category_result['category'])
+            try:
+                # aclosing releases the LLM slot and breaker probe as soon as the consumer stops reading
+                with trace.span('llm_generation'):
+                    async with aclosing(self._generate_content_stream(
+                        [types.Content(role="user", parts=[types.Part(text=user_prompt)])],
+                        config=types.GenerateContentConfig(
+                            system_instruction=system_prompt,
+                            temperature=0.1,
+                        ),
+                        timeout=min(self.generate_timeout, deadline - loop.time())
+                    )) as chunks:
+                        async for text in chunks:
+                            response_text += text
+                            yield {'type': 'token', 'text': text}
+            except Exception as e:
+                logger.error(f"Response streaming failed: {e}")
+                if not response_text:
+                    response_text = self._get_fallback_response(language)
+                    response_confidence = 0.1
+                    yield {'type': 'token', 'text': response_text}
+            
+            if not response_text:
+                response_text = self._get_fallback_response(language)
+                response_confidence = 0.2
+                yield {'type': 'token', 'text': response_text}
+            
+            if response_confidence is None:
+                response_confidence = self._score_response(response_text, context_chunks, language)
+            
+            result = {
+                'response': response_text,
+                'confidence': min(category_result['confidence'], response_confidence),
+                'category': category_result['category'],
                 'language': language
             }
+            self._cache_response(query_embedding, index_version, result, llm_calls[0])
+            yield {'type': 'done', **result, 'source': 'llm', 'timings': timings}
+            
+        except LLMOverloadedError:
+            # Only reachable before the first event, so the caller can still answer 429
+            raise
+        except Exception as e:
+            logger.error(f"Chat streaming failed: {e}")
+            if not response_text:
+                response_text = self._get_fallback_response(language)
+                yield {'type': 'token', 'text': response_text}
+            yield {
+                'type': 'done',
+                'response': response_text,
+                'confidence': 0.1,
+                'category': 'unknown',
+                'language': language,
+                'source': 'error'
+            }
+
+    def _match_faq(self, message: str, language: str, query_embedding: Optional[List[float]], threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Answer from the curated FAQ index when the query matches a stored question"""
+        entry = self.faq_index.match(message, language, query_embedding, threshold=threshold)
+        if entry is None:
+            return None
+        return {
+            'response': entry['answer'],
+            'confidence': entry['score'],
+            'category': entry['category'],
+            'language': language,
+            'faq_id': entry['id'],
+            'source': 'faq'
+        }
+
+    def _degraded_response(self, message: str, language: str, query_embedding: Optional[List[float]]) -> Dict[str, Any]:
+        """Answer without the LLM while its circuit breaker is open: a looser FAQ match, else the support hand-off"""
+        self.degraded_responses += 1
+        faq_answer = self._match_faq(message, language, query_embedding, threshold=self.faq_fallback_threshold)
+        if faq_answer is not None:
+            return {**faq_answer, 'source': 'degraded'}
+        return {
+            'response': self._get_fallback_response(language),
+            'confidence': 0.1,
+            'category': self.query_classifier.classify(message)['category'],
+            'language': language,
+            'source': 'degraded'
+        }
+
+    async def _embed_query(self, message: str) -> Optional[List[float]]:
+        """Embed the query once for the response cache and retrieval"""
+        try:
+            return await self.vector_store.embedding_generator.generate_embedding(message)
+        except Exception as e:
+            logger.error(f"Query embedding failed: {e}")
+            return None
+
+    async def _run_pipeline(self, pipeline: StagePipeline, llm_calls: List[int], deadline: float, trace: Trace, **inputs: Any):
+        """Run a stage pipeline, counting its LLM calls into ``llm_calls`` and its spans into ``trace``;
+        stages still running at the deadline are cancelled"""
+        calls_token = _request_llm_calls.set(llm_calls)
+        deadline_token = _request_deadline.set(deadline)
+        try:
+            # Reads stay on the index generation that was active when the request started
+            with self.vector_store.pin_generation(), trace.activate():
+                async with asyncio.timeout_at(deadline):
+                    return await pipeline.run(**inputs)
+        except TimeoutError:
+            self.deadline_exceeded += 1
+            logger.warning("Chat request deadline exceeded")
+            raise
+        finally:
+            _request_deadline.reset(deadline_token)
+            _request_llm_calls.reset(calls_token)
+
+    def _call_timeout(self, timeout: float) -> float:
+        """Cap a per-call timeout to the time left before the current request's deadline"""
+        deadline = _request_deadline.get()
+        if deadline is None:
+            return timeout
+        left = deadline - asyncio.get_running_loop().time()
+        if left <= 0:
+            raise TimeoutError("Request deadline exceeded")
+        return min(timeout, left)
+
+    def _cache_response(self, query_embedding: Optional[List[float]], index_version, result: Dict[str, Any], llm_calls: int) -> None:
+        """Cache an answer that counts as resolved; other answers are not worth repeating"""
+        if query_embedding is not None and result['confidence'] > 0.5:
+            self.response_cache.put(
+                query_embedding, result['language'], index_version,
+                {'response': result['response'], 'confidence': result['confidence'], 'category': result['category']},
+                llm_calls=llm_calls
+            )
 
     async def _categorize_query(self, query: str, language: str) -> Dict[str, Any]:
-        """Categorize the user query"""
+        """Categorize the user query locally, escalating to the LLM when the local classifier is unsure"""
+        with span('categorization'):
+            return await self._categorize(query, language)
+
+    async def _categorize(self, query: str, language: str) -> Dict[str, Any]:
+        """Untimed body of _categorize_query"""
+        local_result = self.query_classifier.classify(query)
+        if local_result['confidence'] >= self.local_classifier_threshold:
+            self.categorization_counts['local'] += 1
+            return local_result
+        
+        self.categorization_counts['llm'] += 1
+        result = await self._categorize_with_llm(query, language)
+        
+        # Confident LLM labels become training data for the local classifier
+        if result.pop('from_llm', False) and result['confidence'] >= self.local_classifier_threshold:
+            self.query_classifier.learn(query, result['category'])
+        
+        return result
+
+    async def _categorize_with_llm(self, query: str, language: str) -> Dict[str, Any]:
+        """Categorize the user query with the LLM"""
         try:
             prompt = self.category_prompt.get(language, self.category_prompt['en']).format(query=query)
             
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
+            response = await self._generate_content(prompt, timeout=self.categorize_timeout, kind='categorize')
             
             if response.text:
                 # Try to extract JSON from response
@@ -107,7 +549,8 @@ class ChatbotAgent:
                         result = json.loads(json_text)
                         return {
                             'category': result.get('category', 'unknown'),
-                            'confidence': float(result.get('confidence', 0.5))
+                            'confidence': float(result.get('confidence', 0.5)),
+                            'from_llm': True
                         }
                 except json.JSONDecodeError as je:
                     logger.error(f"JSON parsing failed: {je}, response: {response.text}")
@@ -123,98 +566,166 @@ class ChatbotAgent:
             else:
                 return {'category': 'unknown', 'confidence': 0.3}
                 
+        except (LLMOverloadedError, CircuitOpenError):
+            # The local classifier is a better guess than 'unknown' when the LLM is saturated or failing
+            return self.query_classifier.classify(query)
         except Exception as e:
             logger.error(f"Query categorization failed: {e}")
             return {'category': 'unknown', 'confidence': 0.2}
 
-    async def _retrieve_context(self, query: str, language: str, top_k: int = 5) -> List[str]:
+    async def _retrieve_context(self, query: str, language: str, top_k: int = 5, embedding: Optional[List[float]] = None) -> List[str]:
         """Retrieve relevant context from vector store"""
+        results = await self._retrieve_results(query, language, top_k=top_k, embedding=embedding)
+        return self._pack_context(results)
+
+    async def _retrieve_stage(self, state: Dict[str, Any], pack: bool = True):
+        """Pipeline retrieval stage: packed context, or raw results when ``pack`` is False.
+        
+        Ends the pipeline early, with no LLM call, when nothing relevant was found.
+        """
+        results = await self._retrieve_results(state['message'], state['language'], embedding=state['query_embedding'])
+        
+        if not self._has_relevant_context(results):
+            return EarlyExit(
+                {'response': self._get_no_context_response(state['language']), 'confidence': 0.1},
+                reason='no_relevant_context'
+            )
+        
+        return self._pack_context(results) if pack else results
+
+    def _has_relevant_context(self, results: List[Dict[str, Any]]) -> bool:
+        """Whether the best retrieved chunk is within the relevance threshold"""
+        distances = [result.get('distance', 0.0) for result in results if result.get('text')]
+        if not distances:
+            return False
+        return self.retrieval_max_distance is None or min(distances) <= self.retrieval_max_distance
+
+    def _pack_context(self, results: List[Dict[str, Any]]) -> List[str]:
+        """Deduplicate retrieved chunks and pack them into the context token budget"""
+        with span('context_assembly'):
+            packed = self.context_assembler.assemble(results)
+        logger.debug(
+            f"Context packed: ~{packed['context_tokens']} of ~{packed['retrieved_tokens']} retrieved tokens, "
+            f"{packed['duplicates_dropped']} duplicates dropped, {packed['overlap_chars_removed']} overlap chars removed"
+        )
+        return packed['chunks']
+
+    async def _retrieve_results(self, query: str, language: str, top_k: int = 5, embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Search the vector store, returning chunks with their metadata.
+        
+        Chunks in the query language are preferred; when too few of them match,
+        the remaining slots are filled from a search across all languages.
+        """
         try:
-            # Search for relevant documents
-            results = await self.vector_store.similarity_search(query, top_k=top_k)
-            
-            # Extract text chunks
-            context_chunks = []
-            for result in results:
-                if 'text' in result:
-                    context_chunks.append(result['text'])
-            
-            return context_chunks
+            with span('vector_search'):
+                # Reuse the query embedding when there is one, so a fallback search does not embed again;
+                # the store fuses vector and keyword (BM25) matches
+                if embedding is None:
+                    embedding = await self.vector_store.embedding_generator.generate_embedding(query)
+                
+                if self.language_min_results <= 0 or not language:
+                    self.retrieval_counts['unfiltered'] += 1
+                    return await self.vector_store.similarity_search(query, top_k=top_k, embedding=embedding)
+                
+                results = await self.vector_store.similarity_search(query, top_k=top_k, where={"language": language}, embedding=embedding)
+                if len(results) >= min(self.language_min_results, top_k):
+                    self.retrieval_counts['language_filtered'] += 1
+                    return results
+                
+                # Too few chunks in this language (or an index built before chunks were tagged)
+                self.retrieval_counts['cross_language_fallback'] += 1
+                seen = {result['id'] for result in results}
+                for result in await self.vector_store.similarity_search(query, top_k=top_k, embedding=embedding):
+                    if len(results) >= top_k:
+                        break
+                    if result['id'] not in seen:
+                        seen.add(result['id'])
+                        results.append(result)
+                return results
             
         except Exception as e:
             logger.error(f"Context retrieval failed: {e}")
             return []
 
+    def _build_answer_prompts(self, query: str, context_chunks: List[str], language: str, category: str):
+        """Build the system and user prompts for a RAG answer"""
+        # Prepare context
+        context_text = "\n\n".join(context_chunks) if context_chunks else "No relevant context found."
+        
+        # Language-specific prompts
+        if language == 'ar':
+            system_prompt = f"""
+            أنت مساعد دعم عملاء ذكي. استخدم المعلومات المقدمة فقط للإجابة على استفسار العميل.
+            فئة الاستفسار: {category}
+            
+            قواعد مهمة:
+            1. استخدم فقط المعلومات المقدمة في السياق
+            2. إذا لم تجد إجابة في السياق، قل "أعتذر، لا أستطيع العثور على معلومات محددة حول هذا الموضوع"
+            3. كن مفيداً ومهذباً
+            4. قدم إجابات واضحة ومفصلة
+            
+            السياق المتاح:
+            {context_text}
+            """
+            
+            user_prompt = f"استفسار العميل: {query}"
+        else:
+            system_prompt = f"""
+            You are an intelligent customer support assistant. Use ONLY the provided information to answer the customer's query.
+            Query category: {category}
+            
+            Important rules:
+            1. Use only the information provided in the context
+            2. If you cannot find an answer in the context, say "I apologize, but I cannot find specific information about this topic"
+            3. Be helpful and polite
+            4. Provide clear and detailed answers
+            
+            Available context:
+            {context_text}
+            """
+            
+            user_prompt = f"Customer query: {query}"
+        
+        logger.info(f"RAG prompt: ~{estimate_tokens(system_prompt) + estimate_tokens(user_prompt)} tokens, {len(context_chunks)} context chunks")
+        return system_prompt, user_prompt
+
+    def _score_response(self, response_text: str, context_chunks: List[str], language: str) -> float:
+        """Calculate confidence based on context availability and response quality"""
+        confidence = 0.8 if context_chunks else 0.3
+        
+        # Lower confidence if response indicates uncertainty
+        uncertainty_phrases = {
+            'en': ['cannot find', 'not sure', 'unclear', 'apologize'],
+            'ar': ['لا أستطيع', 'غير متأكد', 'أعتذر', 'غير واضح']
+        }
+        
+        response_lower = response_text.lower()
+        for phrase in uncertainty_phrases.get(language, uncertainty_phrases['en']):
+            if phrase in response_lower:
+                confidence = min(confidence, 0.4)
+                break
+        
+        return confidence
+
     async def _generate_response(self, query: str, context_chunks: List[str], language: str, category: str) -> Dict[str, Any]:
         """Generate response using Gemini with retrieved context"""
         try:
-            # Prepare context
-            context_text = "\n\n".join(context_chunks) if context_chunks else "No relevant context found."
-            
-            # Language-specific prompts
-            if language == 'ar':
-                system_prompt = f"""
-                أنت مساعد دعم عملاء ذكي. استخدم المعلومات المقدمة فقط للإجابة على استفسار العميل.
-                فئة الاستفسار: {category}
-                
-                قواعد مهمة:
-                1. استخدم فقط المعلومات المقدمة في السياق
-                2. إذا لم تجد إجابة في السياق، قل "أعتذر، لا أستطيع العثور على معلومات محددة حول هذا الموضوع"
-                3. كن مفيداً ومهذباً
-                4. قدم إجابات واضحة ومفصلة
-                
-                السياق المتاح:
-                {context_text}
-                """
-                
-                user_prompt = f"استفسار العميل: {query}"
-            else:
-                system_prompt = f"""
-                You are an intelligent customer support assistant. Use ONLY the provided information to answer the customer's query.
-                Query category: {category}
-                
-                Important rules:
-                1. Use only the information provided in the context
-                2. If you cannot find an answer in the context, say "I apologize, but I cannot find specific information about this topic"
-                3. Be helpful and polite
-                4. Provide clear and detailed answers
-                
-                Available context:
-                {context_text}
-                """
-                
-                user_prompt = f"Customer query: {query}"
-            
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=user_prompt)])
-                ],
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    temperature=0.1,  # Lower temperature for more consistent responses
-                ),
-            )
+            system_prompt, user_prompt = self._build_answer_prompts(query, context_chunks, language, category)
+            
+            with span('llm_generation'):
+                response = await self._generate_content(
+                    [types.Content(role="user", parts=[types.Part(text=user_prompt)])],
+                    config=types.GenerateContentConfig(
+                        system_instruction=system_prompt,
+                        temperature=0.1,  # Lower temperature for more consistent responses
+                    ),
+                    timeout=self.generate_timeout
+                )
             
             if response.text:
-                # Calculate confidence based on context availability and response quality
-                confidence = 0.8 if context_chunks else 0.3
-                
-                # Lower confidence if response indicates uncertainty
-                uncertainty_phrases = {
-                    'en': ['cannot find', 'not sure', 'unclear', 'apologize'],
-                    'ar': ['لا أستطيع', 'غير متأكد', 'أعتذر', 'غير واضح']
-                }
-                
-                response_lower = response.text.lower()
-                for phrase in uncertainty_phrases.get(language, uncertainty_phrases['en']):
-                    if phrase in response_lower:
-                        confidence = min(confidence, 0.4)
-                        break
-                
                 return {
                     'response': response.text,
-                    'confidence': confidence
+                    'confidence': self._score_response(response.text, context_chunks, language)
                 }
             else:
                 return {
@@ -222,6 +733,8 @@ class ChatbotAgent:
                     'confidence': 0.2
                 }
                 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Response generation failed: {e}")
             return {
@@ -229,6 +742,260 @@ class ChatbotAgent:
                 'confidence': 0.1
             }
 
+    async def _categorize_and_generate(self, query: str, context_chunks: List[str], language: str) -> Dict[str, Any]:
+        """Combined mode: one LLM call returns the category and the answer.
+
+        Queries the local classifier is sure about only need the answer call.
+        If the combined response cannot be parsed, fall back to the two-call path.
+        """
+        local_result = self.query_classifier.classify(query)
+        if local_result['confidence'] >= self.local_classifier_threshold:
+            self.categorization_counts['local'] += 1
+            return {
+                'category': local_result,
+                'response': await self._generate_response(query, context_chunks, language, local_result['category'])
+            }
+        
+        self.combined_counts['calls'] += 1
+        parsed = None
+        try:
+            system_prompt, user_prompt = self._build_answer_prompts(query, context_chunks, language, "to be determined")
+            system_prompt += self.combined_instructions
+            
+            with span('llm_generation'):
+                response = await self._generate_content(
+                    [types.Content(role="user", parts=[types.Part(text=user_prompt)])],
+                    config=types.GenerateContentConfig(
+                        system_instruction=system_prompt,
+                        temperature=0.1,
+                        response_mime_type="application/json",
+                        response_schema=CategorizedAnswer
+                    ),
+                    timeout=self.generate_timeout,
+                    kind='combined'
+                )
+            parsed = self._parse_categorized_answer(response)
+        except (LLMOverloadedError, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Combined categorization and generation failed: {e}")
+        
+        if parsed is None:
+            # Fall back to separate categorization and answer calls
+            self.combined_counts['fallbacks'] += 1
+            category_result = await self._categorize_query(query, language)
+            return {
+                'category': category_result,
+                'response': await self._generate_response(query, context_chunks, language, category_result['category'])
+            }
+        
+        self.categorization_counts['llm'] += 1
+        if parsed.confidence >= self.local_classifier_threshold:
+            self.query_classifier.learn(query, parsed.category)
+        
+        return {
+            'category': {'category': parsed.category, 'confidence': parsed.confidence},
+            'response': {
+                'response': parsed.answer,
+                'confidence': self._score_response(parsed.answer, context_chunks, language)
+            }
+        }
+
+    def _parse_categorized_answer(self, response) -> Optional[CategorizedAnswer]:
+        """Read a combined response, tolerating prose or code fences around the JSON"""
+        parsed = getattr(response, 'parsed', None)
+        if not isinstance(parsed, CategorizedAnswer):
+            text = (response.text or '').strip()
+            start, end = text.find('{'), text.rfind('}') + 1
+            if start < 0 or end <= start:
+                return None
+            try:
+                parsed = CategorizedAnswer.model_validate(json.loads(text[start:end]))
+            except ValueError:
+                return None
+        
+        if parsed.category not in CATEGORIES or not parsed.answer.strip():
+            return None
+        parsed.confidence = min(max(parsed.confidence, 0.0), 1.0)
+        return parsed
+
+    async def _generate_content(self, contents, config: Optional[types.GenerateContentConfig] = None, timeout: Optional[float] = None, kind: str = 'generate'):
+        """Single entry point for Gemini calls: async client, pooled connection, admission limits,
+        circuit breaker, optional hedging and a per-call timeout capped by the request deadline"""
+        timeout = timeout or self.generate_timeout
+        calls = _request_llm_calls.get()
+        if calls is not None:
+            calls[0] += 1
+        
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        probe = self.circuit_breaker.state == 'half_open'
+        
+        async def attempt():
+            # Waiting for a slot does not count against the call timeout, only against the deadline
+            async with self.llm_limiter.slot(timeout=self._call_timeout(timeout)):
+                call_timeout = self._call_timeout(timeout)
+                call_config = config.model_copy() if config else types.GenerateContentConfig()
+                call_config.http_options = types.HttpOptions(timeout=int(call_timeout * 1000))
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=self.llm_model,
+                            contents=contents,
+                            config=call_config
+                        ),
+                        call_timeout
+                    )
+                except Exception:
+                    self.circuit_breaker.record_failure()
+                    _llm_call_seconds.observe(time.perf_counter() - started, kind=kind, outcome='error')
+                    raise
+                self.circuit_breaker.record_success()
+                _llm_call_seconds.observe(time.perf_counter() - started, kind=kind, outcome='success')
+                return response
+        
+        try:
+            if self.hedger is None:
+                return await attempt()
+            # Hedges are not sent while the breaker is probing or the LLM is saturated
+            return await self.hedger.run(
+                kind, attempt,
+                can_hedge=lambda: self.circuit_breaker.state == 'closed' and not self.llm_limiter.is_saturated()
+            )
+        finally:
+            if probe:
+                self.circuit_breaker.release_probe()
+
+    def train_classifier_from_chat_logs(self, chat_logs: List[Dict[str, Any]], min_confidence: float = 0.7) -> int:
+        """Train the local classifier on logged queries whose category was assigned confidently"""
+        return self.query_classifier.fit(
+            (log['message'], log['category'])
+            for log in chat_logs
+            if log.get('confidence', 0.0) >= min_confidence and log.get('feedback_type') != 'dislike'
+        )
+
+    def get_classifier_stats(self) -> Dict[str, Any]:
+        """Get local classifier usage and the rate of escalations to the LLM"""
+        total = sum(self.categorization_counts.values())
+        return {
+            **self.query_classifier.get_stats(),
+            'threshold': self.local_classifier_threshold,
+            'answered_locally': self.categorization_counts['local'],
+            'escalated_to_llm': self.categorization_counts['llm'],
+            'escalation_rate': self.categorization_counts['llm'] / total if total else 0.0
+        }
+
+    def get_response_cache_stats(self) -> Dict[str, Any]:
+        """Get response cache hit ratio and saved LLM calls"""
+        return self.response_cache.get_stats()
+
+    def get_single_flight_stats(self) -> Dict[str, Any]:
+        """Get how many chat requests and query embeddings were coalesced"""
+        return {
+            'chat': self.chat_single_flight.get_stats(),
+            'query_embedding': self.vector_store.embedding_generator.get_single_flight_stats()
+        }
+
+    def get_llm_limiter_stats(self) -> Dict[str, Any]:
+        """Get LLM queue depth, wait times and rejections"""
+        return self.llm_limiter.get_stats()
+
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        """Get deadline misses, hedging and circuit breaker state of the Gemini calls"""
+        return {
+            'request_deadline_s': self.request_deadline,
+            'deadline_exceeded': self.deadline_exceeded,
+            'degraded_responses': self.degraded_responses,
+            'circuit_breaker': self.circuit_breaker.get_stats(),
+            'hedging': self.hedger.get_stats() if self.hedger else None
+        }
+
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """Get how often retrieval stayed within the query language or fell back to all languages"""
+        searches = sum(self.retrieval_counts.values())
+        return {
+            'language_min_results': self.language_min_results,
+            **self.retrieval_counts,
+            'fallback_rate': self.retrieval_counts['cross_language_fallback'] / searches if searches else 0.0
+        }
+
+    def get_context_stats(self) -> Dict[str, Any]:
+        """Get prompt context sizes before and after packing"""
+        return self.context_assembler.get_stats()
+
+    def get_pipeline_stats(self) -> Dict[str, Any]:
+        """Get per-stage timings of the chat pipeline"""
+        stats = {'agent_mode': self.agent_mode, **self.pipeline.get_stats()}
+        if self.agent_mode == 'combined':
+            stats['combined_calls'] = self.combined_counts['calls']
+            stats['combined_fallbacks'] = self.combined_counts['fallbacks']
+        return stats
+
+    async def _generate_content_stream(self, contents, config: Optional[types.GenerateContentConfig] = None, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Streaming counterpart of _generate_content, yielding text as it arrives.
+        
+        The timeout bounds the whole stream, but only fetching the next chunk runs
+        under it, so the deadline never cancels the consumer between chunks. A
+        deadline the consumer used up is not a breaker failure.
+        """
+        timeout = timeout or self.generate_timeout
+        if timeout <= 0:
+            raise TimeoutError("Request deadline exceeded")
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError("Gemini circuit breaker is open")
+        probe = self.circuit_breaker.state == 'half_open'
+        
+        config = config.model_copy() if config else types.GenerateContentConfig()
+        config.http_options = types.HttpOptions(timeout=int(timeout * 1000))
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        
+        try:
+            async with self.llm_limiter.slot(timeout=timeout):
+                started = time.perf_counter()
+                chunks = None
+                while True:
+                    if chunks is not None and loop.time() >= end:
+                        raise TimeoutError("Request deadline exceeded")
+                    # Yield outside the deadline scope, so a timeout only ever cancels the LLM read
+                    try:
+                        async with asyncio.timeout_at(end):
+                            if chunks is None:
+                                stream = await self.client.aio.models.generate_content_stream(
+                                    model=self.llm_model,
+                                    contents=contents,
+                                    config=config
+                                )
+                                chunks = aiter(stream)
+                            chunk = await anext(chunks)
+                    except StopAsyncIteration:
+                        break
+                    except Exception:
+                        self.circuit_breaker.record_failure()
+                        _llm_call_seconds.observe(time.perf_counter() - started, kind='generate_stream', outcome='error')
+                        raise
+                    if chunk.text:
+                        yield chunk.text
+                self.circuit_breaker.record_success()
+                _llm_call_seconds.observe(time.perf_counter() - started, kind='generate_stream', outcome='success')
+        finally:
+            if probe:
+                self.circuit_breaker.release_probe()
+
+    async def close(self) -> None:
+        """Close the pooled HTTP connection"""
+        await self.http_client.aclose()
+
+    def _get_no_context_response(self, language: str) -> str:
+        """Get the hand-off response when the documents have nothing relevant"""
+        no_context_responses = {
+            'en': "I apologize, but I cannot find specific information about this topic. I've passed your question to our support team, who will follow up with you.",
+            'ar': "أعتذر، لا أستطيع العثور على معلومات محددة حول هذا الموضوع. لقد أحلت سؤالك إلى فريق الدعم وسيتواصلون معك."
+        }
+        
+        return no_context_responses.get(language, no_context_responses['en'])
+
     def _get_fallback_response(self, language: str) -> str:
         """Get fallback response when processing fails"""
         fallback_responses = {
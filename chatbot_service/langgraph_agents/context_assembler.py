@@ -0,0 +1,156 @@
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from utils.tokenizer import estimate_tokens, normalize_text
+
+_WHITESPACE = re.compile(r"\s+")
+_SENTENCE_END = re.compile(r"[.!?؟\n]")
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    """Word trigrams, for spotting near-identical chunks"""
+    words = normalize_text(text).split()
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _overlap_length(earlier: str, later: str, min_overlap: int, max_overlap: int) -> int:
+    """Length of the longest suffix of ``earlier`` that is also a prefix of ``later``"""
+    for length in range(min(len(earlier), len(later), max_overlap), min_overlap - 1, -1):
+        if earlier.endswith(later[:length]):
+            return length
+    return 0
+
+
+class ContextAssembler:
+    """Packs retrieved chunks into the RAG prompt context under a token budget.
+
+    Chunks are taken most relevant first. Near-identical chunks are dropped,
+    the text a chunk shares with an already selected neighbour of the same
+    file (the chunker's overlap) is cut, and packing stops at the token
+    budget, trimming the last chunk at a sentence boundary when it helps.
+    """
+
+    def __init__(self, token_budget: int = 1500, duplicate_similarity: float = 0.9, min_overlap: int = 20, max_overlap: int = 400, min_fragment_tokens: int = 40):
+        self.token_budget = token_budget
+        self.duplicate_similarity = duplicate_similarity
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.min_fragment_tokens = min_fragment_tokens
+
+        # Packing statistics
+        self.requests = 0
+        self.tokens_retrieved = 0
+        self.tokens_packed = 0
+        self.duplicates_dropped = 0
+        self.overlap_chars_removed = 0
+        self.chunks_truncated = 0
+        self.chunks_over_budget = 0
+
+    def assemble(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Select and trim chunks; returns the context chunks and the packing counts for this request"""
+        # Hybrid results carry a fused rank score; plain vector results only a distance
+        ranked = sorted(
+            (result for result in results if result.get('text')),
+            key=lambda result: (-result.get('rrf_score', 0.0), result.get('distance', 0.0))
+        )
+
+        selected: List[Dict[str, Any]] = []
+        selected_shingles: List[Set[str]] = []
+        used_tokens = 0
+        retrieved_tokens = 0
+        duplicates = overlap_chars = truncated = over_budget = 0
+
+        for result in ranked:
+            text = _WHITESPACE.sub(" ", result['text']).strip()
+            retrieved_tokens += estimate_tokens(text)
+
+            shingles = _shingles(text)
+            if any(len(shingles & other) / max(1, min(len(shingles), len(other))) >= self.duplicate_similarity for other in selected_shingles):
+                duplicates += 1
+                continue
+
+            # Cut text shared with a neighbouring chunk of the same file
+            filename = result.get('metadata', {}).get('filename')
+            for other in selected:
+                if filename is None or other['filename'] != filename:
+                    continue
+                prefix = _overlap_length(other['text'], text, self.min_overlap, self.max_overlap)
+                if prefix:
+                    text = text[prefix:].lstrip()
+                    overlap_chars += prefix
+                suffix = _overlap_length(text, other['text'], self.min_overlap, self.max_overlap)
+                if suffix:
+                    text = text[:len(text) - suffix].rstrip()
+                    overlap_chars += suffix
+            if not text:
+                duplicates += 1
+                continue
+
+            tokens = estimate_tokens(text)
+            remaining = self.token_budget - used_tokens
+            if tokens > remaining:
+                text = self._truncate(text, remaining)
+                if text is None:
+                    over_budget += 1
+                    continue
+                tokens = estimate_tokens(text)
+                truncated += 1
+
+            selected.append({'text': text, 'filename': filename})
+            selected_shingles.append(shingles)
+            used_tokens += tokens
+
+        self.requests += 1
+        self.tokens_retrieved += retrieved_tokens
+        self.tokens_packed += used_tokens
+        self.duplicates_dropped += duplicates
+        self.overlap_chars_removed += overlap_chars
+        self.chunks_truncated += truncated
+        self.chunks_over_budget += over_budget
+
+        return {
+            'chunks': [chunk['text'] for chunk in selected],
+            'retrieved_tokens': retrieved_tokens,
+            'context_tokens': used_tokens,
+            'duplicates_dropped': duplicates,
+            'overlap_chars_removed': overlap_chars,
+            'chunks_truncated': truncated,
+            'chunks_over_budget': over_budget
+        }
+
+    def _truncate(self, text: str, max_tokens: int) -> Optional[str]:
+        """Cut text to fit max_tokens at the last sentence end, or None if too little would remain"""
+        if max_tokens < self.min_fragment_tokens:
+            return None
+
+        # Characters per token of this text, to place the first cut
+        ratio = len(text) / max(1, estimate_tokens(text))
+        cut = int(max_tokens * ratio)
+        while cut > 0:
+            fragment = text[:cut]
+            ends = [match.end() for match in _SENTENCE_END.finditer(fragment)]
+            if ends:
+                fragment = fragment[:ends[-1]]
+            elif ' ' in fragment:
+                fragment = fragment[:fragment.rfind(' ')]
+            fragment = fragment.strip()
+            if fragment and estimate_tokens(fragment) <= max_tokens:
+                return fragment if estimate_tokens(fragment) >= self.min_fragment_tokens else None
+            cut = int(cut * 0.9)
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get average context size before and after packing"""
+        requests = self.requests or 1
+        return {
+            'token_budget': self.token_budget,
+            'requests': self.requests,
+            'avg_retrieved_tokens': self.tokens_retrieved / requests,
+            'avg_context_tokens': self.tokens_packed / requests,
+            'duplicates_dropped': self.duplicates_dropped,
+            'overlap_chars_removed': self.overlap_chars_removed,
+            'chunks_truncated': self.chunks_truncated,
+            'chunks_over_budget': self.chunks_over_budget
+        }
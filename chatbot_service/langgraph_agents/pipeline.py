@@ -0,0 +1,144 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+
+@dataclass
+class EarlyExit:
+    """Returned by a stage to finish the pipeline at once; stages still running are cancelled"""
+    result: Any
+    reason: str
+
+
+class _PipelineExit(Exception):
+    pass
+
+
+@dataclass
+class Stage:
+    """One pipeline step; ``func`` receives the shared state dict holding the inputs and finished stage results"""
+    name: str
+    func: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: Tuple[str, ...] = ()
+
+
+class StagePipeline:
+    """Runs stages as a dependency graph.
+
+    Every stage starts as soon as the stages it depends on have finished, so
+    independent stages run concurrently. Stages run in one TaskGroup: if any
+    stage raises, the ones still running are cancelled and the error
+    propagates to the caller. A stage that returns ``EarlyExit`` ends the run
+    the same way, but successfully: its result is stored under the stage name
+    and the exit reason under ``'early_exit'``.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage {stage.name}")
+            self.stages[stage.name] = stage
+        self.order = self._topological_order()
+
+        # Timing statistics, in milliseconds
+        self.runs = 0
+        self.wall_ms_total = 0.0
+        self.serial_ms_total = 0.0
+        self.stage_ms_total = {name: 0.0 for name in self.order}
+        self.stage_ms_max = {name: 0.0 for name in self.order}
+        self.stage_runs = {name: 0 for name in self.order}
+        self.outcomes: Dict[str, int] = {'completed': 0}
+
+    def _topological_order(self) -> List[str]:
+        """Check dependencies exist and form no cycle; return the stages in dependency order"""
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+                visit(dep)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def run(self, **inputs: Any) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Run every stage; returns the state dict and per-stage timings in ms, plus 'total'"""
+        state: Dict[str, Any] = dict(inputs)
+        timings: Dict[str, float] = {}
+        finished = {name: asyncio.Event() for name in self.order}
+        started = time.perf_counter()
+
+        async def run_stage(stage: Stage) -> None:
+            for dep in stage.depends_on:
+                await finished[dep].wait()
+            stage_started = time.perf_counter()
+            result = await stage.func(state)
+            timings[stage.name] = (time.perf_counter() - stage_started) * 1000
+            if isinstance(result, EarlyExit):
+                state[stage.name] = result.result
+                state['early_exit'] = result.reason
+                raise _PipelineExit()
+            state[stage.name] = result
+            finished[stage.name].set()
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                for name in self.order:
+                    group.create_task(run_stage(self.stages[name]))
+        except ExceptionGroup as group_error:
+            errors = [error for error in group_error.exceptions if not isinstance(error, _PipelineExit)]
+            # Surface a single failing stage as its own exception
+            if len(errors) == 1:
+                raise errors[0] from None
+            if errors:
+                raise
+
+        timings['total'] = (time.perf_counter() - started) * 1000
+        self._record(state, timings)
+        return state, timings
+
+    def _record(self, state: Dict[str, Any], timings: Dict[str, float]) -> None:
+        self.runs += 1
+        self.wall_ms_total += timings['total']
+        outcome = state.get('early_exit', 'completed')
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for name in self.order:
+            # Stages cancelled by an early exit have no timing
+            if name not in timings:
+                continue
+            self.stage_runs[name] += 1
+            self.stage_ms_total[name] += timings[name]
+            self.stage_ms_max[name] = max(self.stage_ms_max[name], timings[name])
+            self.serial_ms_total += timings[name]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Average stage timings and the latency saved against running the stages one after another"""
+        runs = self.runs or 1
+        return {
+            'runs': self.runs,
+            'stages': {
+                name: {
+                    'depends_on': list(self.stages[name].depends_on),
+                    'runs': self.stage_runs[name],
+                    'avg_ms': self.stage_ms_total[name] / (self.stage_runs[name] or 1),
+                    'max_ms': self.stage_ms_max[name]
+                }
+                for name in self.order
+            },
+            'outcomes': dict(self.outcomes),
+            'avg_wall_ms': self.wall_ms_total / runs,
+            'avg_serial_ms': self.serial_ms_total / runs,
+            'avg_saved_ms': (self.serial_ms_total - self.wall_ms_total) / runs
+        }
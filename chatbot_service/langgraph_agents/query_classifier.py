@@ -0,0 +1,138 @@
+import math
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.tokenizer import tokenize
+
+CATEGORIES = ('Product FAQ', 'Tech issue', 'Transactional')
+
+# Hand-labelled examples so the classifier is useful before any chat logs exist
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("What features does the product have?", 'Product FAQ'),
+    ("What are the product specifications?", 'Product FAQ'),
+    ("How do I use this feature?", 'Product FAQ'),
+    ("Does it support dark mode?", 'Product FAQ'),
+    ("Which plans are available and what do they include?", 'Product FAQ'),
+    ("Is the app available on Android and iOS?", 'Product FAQ'),
+    ("Can I export my data to CSV?", 'Product FAQ'),
+    ("What languages does the product support?", 'Product FAQ'),
+    ("The app crashes when I open it", 'Tech issue'),
+    ("I get an error message when saving", 'Tech issue'),
+    ("The page is very slow to load", 'Tech issue'),
+    ("This button is not working", 'Tech issue'),
+    ("I found a bug in the dashboard", 'Tech issue'),
+    ("The app freezes after the update", 'Tech issue'),
+    ("Sync fails with a connection problem", 'Tech issue'),
+    ("How do I troubleshoot installation issues?", 'Tech issue'),
+    ("I want a refund for my order", 'Transactional'),
+    ("My payment was declined", 'Transactional'),
+    ("Where is my order?", 'Transactional'),
+    ("How do I reset my password?", 'Transactional'),
+    ("I cannot log in to my account", 'Transactional'),
+    ("Please cancel my subscription", 'Transactional'),
+    ("I was charged twice on my invoice", 'Transactional'),
+    ("How do I update my billing details?", 'Transactional'),
+    ("ما هي ميزات المنتج؟", 'Product FAQ'),
+    ("ما هي مواصفات المنتج؟", 'Product FAQ'),
+    ("كيف أستخدم هذه الميزة؟", 'Product FAQ'),
+    ("هل يدعم التطبيق الوضع الليلي؟", 'Product FAQ'),
+    ("ما هي الخطط المتاحة؟", 'Product FAQ'),
+    ("هل التطبيق متوفر على أندرويد؟", 'Product FAQ'),
+    ("التطبيق يتعطل عند فتحه", 'Tech issue'),
+    ("تظهر لي رسالة خطأ عند الحفظ", 'Tech issue'),
+    ("الصفحة بطيئة جدا في التحميل", 'Tech issue'),
+    ("الزر لا يعمل", 'Tech issue'),
+    ("وجدت مشكلة تقنية في التطبيق", 'Tech issue'),
+    ("التطبيق يتجمد بعد التحديث", 'Tech issue'),
+    ("أريد استرداد المبلغ لطلبي", 'Transactional'),
+    ("تم رفض الدفع", 'Transactional'),
+    ("أين طلبي؟", 'Transactional'),
+    ("كيف أعيد تعيين كلمة المرور؟", 'Transactional'),
+    ("لا أستطيع تسجيل الدخول إلى حسابي", 'Transactional'),
+    ("أريد إلغاء اشتراكي", 'Transactional'),
+    ("تم خصم المبلغ مرتين من الفاتورة", 'Transactional'),
+]
+
+
+def _features(text: str) -> List[str]:
+    """Unigram and bigram features, so phrases like 'not working' count as one signal"""
+    tokens = tokenize(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+class QueryClassifier:
+    """Multinomial Naive Bayes over query tokens for the three support categories.
+
+    Classification is a few dictionary lookups per token, well under a
+    millisecond. It learns incrementally from labelled queries, e.g. confident
+    LLM categorizations or stored chat logs.
+    """
+
+    def __init__(self, categories: Iterable[str] = CATEGORIES, seed_examples: Optional[Iterable[Tuple[str, str]]] = SEED_EXAMPLES):
+        self.categories = tuple(categories)
+        self.feature_counts: Dict[str, Counter] = {category: Counter() for category in self.categories}
+        self.feature_totals: Dict[str, int] = {category: 0 for category in self.categories}
+        self.example_counts: Dict[str, int] = {category: 0 for category in self.categories}
+        self.vocabulary: set = set()
+
+        # Classification statistics
+        self.classifications = 0
+        self.classify_ms_total = 0.0
+
+        if seed_examples:
+            self.fit(seed_examples)
+
+    def learn(self, text: str, category: str) -> bool:
+        """Add one labelled query; unknown categories are ignored"""
+        if category not in self.feature_counts:
+            return False
+        features = _features(text)
+        if not features:
+            return False
+        self.feature_counts[category].update(features)
+        self.feature_totals[category] += len(features)
+        self.example_counts[category] += 1
+        self.vocabulary.update(features)
+        return True
+
+    def fit(self, examples: Iterable[Tuple[str, str]]) -> int:
+        """Add labelled (text, category) examples; returns how many were used"""
+        return sum(1 for text, category in examples if self.learn(text, category))
+
+    def classify(self, text: str) -> Dict[str, Any]:
+        """Return the most likely category and its posterior probability"""
+        started = time.perf_counter()
+        features = [feature for feature in _features(text) if feature in self.vocabulary]
+        total_examples = sum(self.example_counts.values())
+
+        if not features or total_examples == 0:
+            result = {'category': 'unknown', 'confidence': 0.0}
+        else:
+            vocabulary_size = len(self.vocabulary)
+            log_scores = {}
+            for category in self.categories:
+                counts = self.feature_counts[category]
+                denominator = self.feature_totals[category] + vocabulary_size
+                score = math.log((self.example_counts[category] + 1) / (total_examples + len(self.categories)))
+                for feature in features:
+                    score += math.log((counts[feature] + 1) / denominator)
+                log_scores[category] = score
+
+            # Softmax over the log scores gives the posterior
+            best = max(log_scores, key=log_scores.get)
+            normalizer = sum(math.exp(score - log_scores[best]) for score in log_scores.values())
+            result = {'category': best, 'confidence': 1.0 / normalizer}
+
+        self.classifications += 1
+        self.classify_ms_total += (time.perf_counter() - started) * 1000
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get training-set size and classification latency"""
+        return {
+            'examples': dict(self.example_counts),
+            'vocabulary_size': len(self.vocabulary),
+            'classifications': self.classifications,
+            'avg_classify_ms': self.classify_ms_total / self.classifications if self.classifications else 0.0
+        }
@@ -8,9 +8,10 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-from app.api import router
+from app.api import router, get_chatbot_agent
 from utils.document_processor import DocumentProcessor
-from vector_store.chroma_store import ChromaStore
+from vector_store.factory import get_vector_store
+from utils.executors import shutdown_executors
 
 app = FastAPI(title="Customer Support Chatbot", version="1.0.0")
 
@@ -31,8 +32,10 @@ async def startup_event():
     """Initialize document processing and vector store on startup"""
     print("Initializing chatbot service...")
     
-    # Initialize vector store
-    vector_store = ChromaStore()
+    # Initialize the agent and vector store here rather than on import, so CPU
+    # pool workers that re-import this module stay lightweight
+    chatbot_agent = get_chatbot_agent()
+    vector_store = get_vector_store()
     
     # Process documents from input folder
     doc_processor = DocumentProcessor()
@@ -41,10 +44,19 @@ async def startup_event():
     if os.path.exists(input_folder):
         await doc_processor.process_folder(input_folder, vector_store)
         print(f"Processed documents from {input_folder}")
+        
+        # Curated FAQ answers
+        await chatbot_agent.faq_index.load_file()
     else:
         print(f"Input folder {input_folder} not found. Creating it...")
         os.makedirs(input_folder, exist_ok=True)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the LLM connection pool and stop the executor pools"""
+    await get_chatbot_agent().close()
+    shutdown_executors()
+
 @app.get("/")
 async def root():
     return {"message": "Customer Support Chatbot Service", "status": "running"}
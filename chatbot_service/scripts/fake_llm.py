@@ -0,0 +1,123 @@
+"""Local stand-in for the Gemini API, for load and resilience testing.
+
+Run it with ``python scripts/fake_llm.py [PORT]`` (default 9000) and point the
+chatbot at it with ``GEMINI_BASE_URL=http://127.0.0.1:9000``.
+
+It answers generateContent and streamGenerateContent for any model. Latency
+and failures can be changed at runtime by posting JSON to ``/config``:
+
+- ``delay``: seconds before the first token (FAKE_LLM_DELAY_MS at startup)
+- ``token_delay``: seconds between streamed chunks (FAKE_LLM_TOKEN_DELAY_MS)
+- ``error_rate``: share of calls answered with a 500 (FAKE_LLM_ERROR_RATE)
+- ``tail_rate`` and ``tail_delay``: share of calls delayed by an extra
+  ``tail_delay`` seconds, for hedging experiments
+
+``/stats`` reports the calls served and the most seen in flight at once;
+``/reset`` clears those counters.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = "To reset your password, open the login page, click Forgot Password and follow the emailed link. " * 3
+
+config = {
+    "delay": float(os.getenv("FAKE_LLM_DELAY_MS", "200")) / 1000,
+    "token_delay": float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "20")) / 1000,
+    "error_rate": float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+    "tail_rate": 0.0,
+    "tail_delay": 1.5
+}
+stats = {"requests": 0, "inflight": 0, "max_inflight": 0, "errors": 0}
+
+app = FastAPI()
+
+
+def _response_body(text: str):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def _answer_for(request_body) -> str:
+    """A plausible answer for each kind of call the agent makes"""
+    raw = json.dumps(request_body, ensure_ascii=False)
+    if "Classify" in raw or "صنف" in raw:
+        return json.dumps({"category": "Tech issue", "confidence": 0.9})
+    if '"answer"' in raw and "responseMimeType" in raw:
+        return json.dumps({"category": "Tech issue", "confidence": 0.9, "answer": ANSWER})
+    return ANSWER
+
+
+def _first_token_delay() -> float:
+    delay = config["delay"]
+    if random.random() < config["tail_rate"]:
+        delay += config["tail_delay"]
+    return delay
+
+
+@app.post("/config")
+async def update_config(request: Request):
+    config.update(await request.json())
+    return config
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/reset")
+async def reset_stats():
+    stats.update(requests=0, max_inflight=0, errors=0)
+    return stats
+
+
+@app.post("/{path:path}")
+async def generate(path: str, request: Request):
+    request_body = await request.json()
+    stats["requests"] += 1
+    stats["inflight"] += 1
+    stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+    streaming = False
+    try:
+        if random.random() < config["error_rate"]:
+            stats["errors"] += 1
+            await asyncio.sleep(config["delay"] / 4)
+            return JSONResponse({"error": {"code": 500, "message": "injected failure", "status": "INTERNAL"}}, status_code=500)
+
+        text = _answer_for(request_body)
+        words = text.split(" ")
+        pieces = [" ".join(words[i:i + 3]) + " " for i in range(0, len(words), 3)]
+
+        if "streamGenerateContent" in path:
+            delay = _first_token_delay()
+
+            async def events():
+                # The call stays in flight until the last chunk is sent
+                try:
+                    await asyncio.sleep(delay)
+                    for piece in pieces:
+                        yield "data: " + json.dumps(_response_body(piece)) + "\r\n\r\n"
+                        await asyncio.sleep(config["token_delay"])
+                finally:
+                    stats["inflight"] -= 1
+
+            streaming = True
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        # Same total generation time as the streamed variant
+        await asyncio.sleep(_first_token_delay() + len(pieces) * config["token_delay"])
+        return _response_body(text)
+    finally:
+        if not streaming:
+            stats["inflight"] -= 1
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9000
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
@@ -0,0 +1,83 @@
+"""Fire concurrent /chat requests at a running chatbot and report throughput, latency and 429s.
+
+Start the fake LLM and the chatbot first, for example::
+
+    python scripts/fake_llm.py 9000
+    GEMINI_API_KEY=fake GEMINI_BASE_URL=http://127.0.0.1:9000 RESPONSE_CACHE_SIZE=0 \\
+        LLM_MAX_CONCURRENCY=4 LLM_MAX_QUEUE=8 uvicorn main:app --port 8000
+
+then run ``python scripts/load_test.py --concurrency 50 --requests 200``.
+Every message is distinct unless ``--queries`` names a file of messages, so
+the response cache and request coalescing do not hide the LLM load.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_load(args) -> None:
+    queries = []
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        if args.llm_url:
+            await client.post(f"{args.llm_url}/reset")
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        statuses = Counter()
+        retry_after = []
+
+        async def one(i):
+            message = queries[i % len(queries)] if queries else f"How do I reset my password? (request {i})"
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(f"{args.url}/chat", json={"message": message, "session_id": f"load-{i}", "language": "en"})
+                latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            if response.status_code == 429:
+                retry_after.append(int(response.headers.get("Retry-After", "0")))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        print(f"{args.requests} chats from {args.concurrency} clients in {elapsed:.1f} s: {args.requests / elapsed:.1f} chats/s")
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, p99 {_percentile(latencies, 0.99) * 1000:.0f} ms")
+        print(f"statuses {dict(sorted(statuses.items()))}")
+        if retry_after:
+            print(f"Retry-After on 429: min {min(retry_after)} s, max {max(retry_after)} s")
+
+        limiter = (await client.get(f"{args.url}/stats")).json().get("llm_limiter")
+        if limiter:
+            print(f"limiter: max queue depth {limiter['max_queue_depth']}, rejected (queue full) {limiter['rejected_queue_full']}, rejected (timeout) {limiter['rejected_timeout']}")
+        if args.llm_url:
+            llm = (await client.get(f"{args.llm_url}/stats")).json()
+            print(f"fake LLM: {llm['requests']} calls, at most {llm['max_inflight']} in flight")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="chatbot base URL")
+    parser.add_argument("--llm-url", default="http://127.0.0.1:9000", help="fake LLM base URL, or empty to skip its stats")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--queries", help="file with one message per line")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(run_load(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
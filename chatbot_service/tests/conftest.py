@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service imports its packages from the chatbot_service directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
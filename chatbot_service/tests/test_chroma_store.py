@@ -0,0 +1,36 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+
+def test_pinned_reads_use_the_distance_space_of_the_pinned_collection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "0")
+
+    from utils.executors import shutdown_executors
+    from vector_store.chroma_store import ChromaStore
+
+    async def run():
+        store = ChromaStore("space_test")
+        texts = ["Restart the router.", "Reset your password from the login page."]
+        embeddings = await store.embedding_generator.generate_embeddings_batch(texts)
+        await store.add_documents(["doc_0", "doc_1"], embeddings, texts, [{"filename": "faq.txt"}] * 2)
+        query = [2 * value for value in embeddings[0]]
+
+        with store.pin_generation():
+            # A swap to a collection in another distance space lands while the request is pinned
+            store.collection = store.client.create_collection(name="space_test_cosine", metadata={"hnsw:space": "cosine"})
+            results = await store._get_with_distance(["doc_0", "doc_1"], query, None)
+        return embeddings, query, results
+
+    try:
+        embeddings, query, results = asyncio.run(run())
+    finally:
+        shutdown_executors()
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    expected = np.sum((vectors - np.asarray(query, dtype=np.float32)) ** 2, axis=1)
+    distances = {result['id']: result['distance'] for result in results}
+    assert distances["doc_0"] == pytest.approx(float(expected[0]), rel=1e-4)
+    assert distances["doc_1"] == pytest.approx(float(expected[1]), rel=1e-4)
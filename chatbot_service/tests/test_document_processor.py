@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+
+from utils.document_processor import DocumentProcessor
+
+
+def test_upgrade_replaces_baseline_vectors_instead_of_duplicating(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "0")
+
+    from utils.executors import shutdown_executors
+    from vector_store.chroma_store import ChromaStore
+
+    folder = tmp_path / "input"
+    folder.mkdir()
+    file_path = folder / "router.txt"
+    file_path.write_text(" ".join(f"Restart the router and check cable {i}." for i in range(400)))
+    ledger_file = str(tmp_path / "processed_documents.json")
+
+    async def run():
+        store = ChromaStore("upgrade_test")
+
+        # Vectors and ledger as the baseline ingestion wrote them: random ID suffixes, no metadata version
+        file_hash = DocumentProcessor._generate_file_hash(str(file_path))
+        chunks = DocumentProcessor._chunk_text(file_path.read_text())
+        embeddings = await store.embedding_generator.generate_embeddings_batch(chunks)
+        ids = [f"router.txt_chunk_{i}_{uuid.uuid4().hex[:8]}" for i in range(len(chunks))]
+        metadatas = [
+            {"filename": "router.txt", "chunk_index": i, "file_type": ".txt", "file_hash": file_hash, "text": chunk}
+            for i, chunk in enumerate(chunks)
+        ]
+        await store.add_documents(ids, embeddings, chunks, metadatas)
+        with open(ledger_file, "w") as f:
+            json.dump({file_hash: {
+                "filename": "router.txt",
+                "file_path": str(file_path),
+                "file_hash": file_hash,
+                "file_type": ".txt",
+                "file_size": os.path.getsize(file_path),
+                "chunk_count": len(chunks),
+                "indexed_at": datetime.utcnow().isoformat(),
+                "status": "indexed"
+            }}, f)
+        baseline_count = await store.get_document_count()
+
+        processor = DocumentProcessor(processed_docs_file=ledger_file)
+        await processor.process_folder(str(folder), store)
+        upgraded_count = await store.get_document_count()
+        await processor.process_folder(str(folder), store)
+        return len(chunks), baseline_count, upgraded_count, await store.get_document_count(), processor.docs_indexed
+
+    try:
+        chunk_count, baseline_count, upgraded_count, final_count, ledger = asyncio.run(run())
+    finally:
+        shutdown_executors()
+
+    assert chunk_count > 1
+    assert baseline_count == chunk_count
+    assert upgraded_count == chunk_count
+    assert final_count == chunk_count
+    assert len(ledger) == 1
+    assert next(iter(ledger.values()))["metadata_version"] > 1
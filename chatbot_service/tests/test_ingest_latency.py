@@ -0,0 +1,57 @@
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# /health must stay responsive while a full reindex embeds and writes thousands of chunks
+HEALTH_P99_LIMIT = 0.5
+
+
+def test_health_stays_responsive_during_a_full_reindex(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "1")
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", "")
+
+    from app import api
+    from utils.executors import shutdown_executors
+    from vector_store import factory
+
+    monkeypatch.setattr(factory, "_shared_store", None)
+    monkeypatch.setattr(api, "_chatbot_agent", None)
+    monkeypatch.setattr(api, "reindex_state", {**api.reindex_state, "status": "idle"})
+
+    # Three files of about 500 distinct chunks each
+    folder = tmp_path / "input"
+    folder.mkdir()
+    for n in range(3):
+        sentences = (f"Document {n} sentence {i}: reset the router, check cable {i * 7 % 97} and port {i % 13}." for i in range(6000))
+        (folder / f"manual_{n}.txt").write_text(" ".join(sentences))
+
+    app = FastAPI()
+    app.include_router(api.router)
+    latencies = []
+
+    try:
+        with TestClient(app) as client:
+            # The reindex runs as a background task of this request, so post it from another thread
+            reindex = threading.Thread(target=client.post, args=("/reindex-documents",))
+            reindex.start()
+            while reindex.is_alive():
+                started = time.perf_counter()
+                assert client.get("/health").status_code == 200
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.01)
+            reindex.join()
+            client.portal.call(api.get_chatbot_agent().close)
+        state = api.reindex_state
+    finally:
+        shutdown_executors()
+
+    assert state["status"] == "completed", state["error"]
+    assert state["chunks_indexed"] > 1000
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    assert p99 < HEALTH_P99_LIMIT, f"/health p99 {p99 * 1000:.0f} ms during reindex"
+    assert len(latencies) >= 20
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.llm_limiter import LLMLimiter, LLMOverloadedError
+
+
+def test_overfilled_limiter_rejects_with_retry_after():
+    async def run():
+        limiter = LLMLimiter(max_concurrency=2, max_queue=2, queue_timeout=5.0)
+        release = asyncio.Event()
+
+        async def call():
+            async with limiter.slot():
+                await release.wait()
+
+        # Two calls in flight and two queued fill the limiter
+        calls = [asyncio.ensure_future(call()) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert limiter.active == 2 and limiter.waiting == 2
+
+        with pytest.raises(LLMOverloadedError) as rejected:
+            async with limiter.slot():
+                pass
+
+        release.set()
+        await asyncio.gather(*calls)
+        return limiter, rejected.value
+
+    limiter, error = asyncio.run(run())
+
+    assert error.retry_after >= 1
+    stats = limiter.get_stats()
+    assert stats['rejected_queue_full'] == 1
+    assert stats['admitted'] == 4
+    assert stats['active'] == 0
+
+
+def test_queue_wait_past_the_timeout_is_rejected():
+    async def run():
+        limiter = LLMLimiter(max_concurrency=1, max_queue=5, queue_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(LLMOverloadedError):
+                async with limiter.slot():
+                    pass
+        return limiter
+
+    limiter = asyncio.run(run())
+
+    assert limiter.get_stats()['rejected_timeout'] == 1
+
+
+def test_chat_endpoint_answers_429_with_retry_after(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "0")
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("LLM_MAX_QUEUE", "0")
+
+    from app import api
+    from langgraph_agents.agent import ChatbotAgent
+    from utils.executors import shutdown_executors
+    from vector_store.local_store import LocalVectorStore
+
+    agent = ChatbotAgent(vector_store=LocalVectorStore("limiter_test"))
+    monkeypatch.setattr(api, "_chatbot_agent", agent)
+    app = FastAPI()
+    app.include_router(api.router)
+
+    try:
+        with TestClient(app) as client:
+            # The only LLM slot is busy and no caller may queue for it
+            with client.portal.wrap_async_context_manager(agent.llm_limiter.slot()):
+                response = client.post("/chat", json={"message": "My router keeps disconnecting", "session_id": "s1", "language": "en"})
+            client.portal.call(agent.close)
+    finally:
+        shutdown_executors()
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert agent.llm_limiter.get_stats()['rejected_queue_full'] == 1
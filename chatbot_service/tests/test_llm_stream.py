@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeStreamModels:
+    """Stands in for client.aio.models, streaming a few chunks with a delay before each"""
+
+    def __init__(self, chunk_delay: float):
+        self.chunk_delay = chunk_delay
+
+    async def generate_content_stream(self, model, contents, config=None):
+        async def chunks():
+            for text in ("Restart ", "the ", "router."):
+                await asyncio.sleep(self.chunk_delay)
+                yield SimpleNamespace(text=text)
+        return chunks()
+
+
+def run_stream(monkeypatch, tmp_path, chunk_delay, consumer_delay, timeout):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "0")
+
+    from langgraph_agents.agent import ChatbotAgent
+    from utils.executors import shutdown_executors
+    from vector_store.local_store import LocalVectorStore
+
+    async def run():
+        agent = ChatbotAgent(vector_store=LocalVectorStore("stream_test"))
+        agent.client = SimpleNamespace(aio=SimpleNamespace(models=FakeStreamModels(chunk_delay)))
+        received = []
+        try:
+            async for text in agent._generate_content_stream(["hi"], timeout=timeout):
+                received.append(text)
+                await asyncio.sleep(consumer_delay)
+            return agent, received, None
+        except Exception as e:
+            return agent, received, e
+        finally:
+            await agent.close()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        shutdown_executors()
+
+
+def test_slow_consumer_gets_a_timeout_instead_of_a_cancellation(tmp_path, monkeypatch):
+    # The deadline passes while the consumer sleeps; the old scope cancelled that sleep
+    agent, received, error = run_stream(monkeypatch, tmp_path, chunk_delay=0.01, consumer_delay=0.15, timeout=0.2)
+
+    assert isinstance(error, TimeoutError)
+    assert received == ["Restart ", "the "]
+    assert agent.circuit_breaker.failures == 0
+    assert agent.llm_limiter.get_stats()['active'] == 0
+
+
+def test_stream_within_the_deadline_records_a_success(tmp_path, monkeypatch):
+    agent, received, error = run_stream(monkeypatch, tmp_path, chunk_delay=0.01, consumer_delay=0.02, timeout=1.0)
+
+    assert error is None
+    assert "".join(received) == "Restart the router."
+    assert agent.circuit_breaker.successes == 1
+    assert agent.llm_limiter.get_stats()['active'] == 0
+
+
+def test_stalled_llm_read_times_out_and_counts_as_a_failure(tmp_path, monkeypatch):
+    agent, received, error = run_stream(monkeypatch, tmp_path, chunk_delay=0.2, consumer_delay=0.0, timeout=0.3)
+
+    assert isinstance(error, TimeoutError)
+    assert received == ["Restart "]
+    assert agent.circuit_breaker.failures == 1
+    assert agent.llm_limiter.get_stats()['active'] == 0
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+class FakeModels:
+    """Stands in for client.aio.models, counting generate_content calls"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        answer = {"category": "Tech issue", "confidence": 0.9, "answer": "Restart the router and try again."}
+        return SimpleNamespace(text=json.dumps(answer), parsed=None)
+
+
+def test_identical_concurrent_chats_make_one_llm_call(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setenv("AGENT_MODE", "combined")
+    monkeypatch.setenv("CPU_EXECUTOR_WORKERS", "0")
+
+    from langgraph_agents.agent import ChatbotAgent
+    from utils.executors import shutdown_executors
+    from vector_store.local_store import LocalVectorStore
+
+    async def run():
+        store = LocalVectorStore("single_flight_test")
+        text = "If the router keeps disconnecting, restart it and update its firmware."
+        embedding = await store.embedding_generator.generate_embedding(text)
+        await store.add_documents(["doc_0"], [embedding], [text], [{"language": "en", "filename": "router.txt"}])
+
+        agent = ChatbotAgent(vector_store=store)
+        fake = FakeModels()
+        agent.client = SimpleNamespace(aio=SimpleNamespace(models=fake))
+        try:
+            results = await asyncio.gather(*[
+                agent.process_chat("My router keeps disconnecting", "en") for _ in range(20)
+            ])
+        finally:
+            await agent.close()
+        return fake, agent, results
+
+    try:
+        fake, agent, results = asyncio.run(run())
+    finally:
+        shutdown_executors()
+
+    assert fake.calls == 1
+    assert len({result['response'] for result in results}) == 1
+    stats = agent.chat_single_flight.get_stats()
+    assert stats['executions'] == 1
+    assert stats['coalesced'] == 19
+
+
+def test_waiters_share_the_exception_and_survive_a_cancelled_caller():
+    async def run():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        executions = 0
+
+        async def failing():
+            nonlocal executions
+            executions += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            raise RuntimeError("upstream failed")
+
+        first = asyncio.ensure_future(flight.do("key", failing))
+        await started.wait()
+        cancelled = asyncio.ensure_future(flight.do("key", failing))
+        waiter = asyncio.ensure_future(flight.do("key", failing))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        for task in (first, waiter):
+            with pytest.raises(RuntimeError, match="upstream failed"):
+                await task
+        assert executions == 1
+        assert flight.get_stats()['inflight'] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency until it has had time to recover.
+
+    The breaker opens when at least ``failure_rate`` of the last ``window``
+    calls failed (once ``min_calls`` have been seen). After ``open_seconds``
+    it lets a single probe call through; success closes it again, failure
+    reopens it for another ``open_seconds``.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, open_seconds: float = 30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+
+        self.state = 'closed'
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        # Breaker statistics
+        self.times_opened = 0
+        self.rejected = 0
+        self.failures = 0
+        self.successes = 0
+
+    def is_open(self) -> bool:
+        """Whether calls are being refused and the recovery wait has not passed yet"""
+        return self.state == 'open' and time.monotonic() - self._opened_at < self.open_seconds
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open state only one probe at a time is allowed"""
+        if self.state == 'open':
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.successes += 1
+        if self.state == 'half_open':
+            self.state = 'closed'
+            self._probe_in_flight = False
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == 'half_open':
+            self._probe_in_flight = False
+            self._open()
+            return
+        self._outcomes.append(False)
+        failed = self._outcomes.count(False)
+        if self.state == 'closed' and len(self._outcomes) >= self.min_calls and failed / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def release_probe(self) -> None:
+        """Give up a half-open probe that ended without an outcome, e.g. because it was cancelled"""
+        if self.state == 'half_open':
+            self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the breaker state and the recent error rate"""
+        recent = len(self._outcomes)
+        return {
+            'state': 'half_open' if self.state == 'open' and not self.is_open() else self.state,
+            'recent_calls': recent,
+            'recent_error_rate': self._outcomes.count(False) / recent if recent else 0.0,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+            'successes': self.successes,
+            'failures': self.failures
+        }
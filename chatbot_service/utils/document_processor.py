@@ -1,9 +1,10 @@
 import os
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import hashlib
 import json
+import time
 
 # Document processing libraries
 import PyPDF2
@@ -12,18 +13,41 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import markdown
 
-from .embeddings import EmbeddingGenerator
+from .embeddings import get_embedding_generator
+from .executors import run_cpu, run_io
+from .language_detector import LanguageDetector
+from .metrics import registry
+from .tokenizer import count_terms
+
+# Bumped when chunk metadata gains fields; documents indexed with an older version are re-ingested
+CHUNK_METADATA_VERSION = 2
+
+ingested_documents = registry.counter(
+    "chatbot_ingest_documents_total",
+    "Documents seen by ingestion, by outcome",
+    ["status"]
+)
+ingested_chunks = registry.counter("chatbot_ingest_chunks_total", "Chunks embedded and written to the vector store")
+ingest_seconds = registry.histogram(
+    "chatbot_ingest_document_duration_seconds",
+    "Time to extract, embed and store one document",
+    ["file_type"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
 
 class DocumentProcessor:
-    def __init__(self):
-        self.embedding_generator = EmbeddingGenerator()
+    def __init__(self, processed_docs_file: str = "processed_documents.json"):
+        self.embedding_generator = get_embedding_generator()
         
         # Simple file tracking without MongoDB
-        self.processed_docs_file = "processed_documents.json"
+        self.processed_docs_file = processed_docs_file
         self.docs_indexed = self._load_processed_docs()
         
         # Supported file types
         self.supported_extensions = {'.pdf', '.docx', '.csv', '.md', '.html', '.txt'}
+        
+        # Number of chunks embedded and written to the vector store per flush
+        self.flush_size = max(1, int(os.getenv("INGEST_FLUSH_SIZE", "256")))
 
     def _load_processed_docs(self):
         """Load processed documents from JSON file"""
@@ -44,91 +68,131 @@ class DocumentProcessor:
             print(f"Error saving processed docs: {e}")
     
     def _doc_exists(self, file_hash):
-        """Check if document was already processed"""
-        return file_hash in self.docs_indexed
+        """Check if document was already processed with the current chunk metadata"""
+        metadata = self.docs_indexed.get(file_hash)
+        return metadata is not None and metadata.get("metadata_version", 1) >= CHUNK_METADATA_VERSION
     
     def _add_processed_doc(self, file_hash, metadata):
         """Add document to processed list"""
         self.docs_indexed[file_hash] = metadata
         self._save_processed_docs()
+    
+    def _doc_hashes(self, filename):
+        """Hashes of every version of a file that is recorded as processed"""
+        return [
+            doc_hash for doc_hash, metadata in self.docs_indexed.items()
+            if metadata.get("filename") == filename
+        ]
+    
+    async def remove_document(self, filename: str, vector_store) -> None:
+        """Remove a source file's vectors and its processed records"""
+        removed = await vector_store.delete_by_source(filename)
+        ingested_documents.inc(status="removed")
+        for doc_hash in self._doc_hashes(filename):
+            del self.docs_indexed[doc_hash]
+        await run_io(self._save_processed_docs)
+        print(f"Removed {removed} chunks of {filename}")
 
-    async def process_folder(self, folder_path: str, vector_store) -> None:
-        """Process all documents in a folder"""
+    async def process_folder(self, folder_path: str, vector_store, force: bool = False, progress: Optional[Dict[str, Any]] = None) -> None:
+        """Process all documents in a folder, skipping unchanged files unless forced.
+        
+        If a ``progress`` dict is given, files_total, files_done and chunks_indexed
+        are kept up to date in it while the folder is processed.
+        """
         if not os.path.exists(folder_path):
             print(f"Folder {folder_path} does not exist")
             return
         
         print(f"Processing documents in {folder_path}...")
         
-        for filename in os.listdir(folder_path):
+        filenames = sorted(os.listdir(folder_path))
+        documents = []
+        for filename in filenames:
             file_path = os.path.join(folder_path, filename)
             
             if os.path.isfile(file_path):
                 file_ext = os.path.splitext(filename)[1].lower()
                 
                 if file_ext in self.supported_extensions:
-                    await self.process_document(file_path, vector_store)
+                    documents.append(file_path)
                 else:
                     print(f"Skipping unsupported file: {filename}")
+        
+        if progress is not None:
+            progress.update({"files_total": len(documents), "files_done": 0, "chunks_indexed": 0})
+        
+        for file_path in documents:
+            await self.process_document(file_path, vector_store, force=force, persist=False)
+            
+            if progress is not None:
+                progress["files_done"] += 1
+                for metadata in self.docs_indexed.values():
+                    if metadata.get("file_path") == file_path and metadata.get("status") == "indexed":
+                        progress["chunks_indexed"] += metadata.get("chunk_count", 0)
+                        break
+        
+        # Drop vectors of files that were deleted from the folder
+        removed = {
+            metadata.get("filename") for metadata in self.docs_indexed.values()
+            if os.path.normpath(os.path.dirname(metadata.get("file_path", ""))) == os.path.normpath(folder_path)
+            and metadata.get("filename") not in filenames
+        }
+        for filename in removed:
+            await self.remove_document(filename, vector_store)
+        
+        # One index save for the whole folder
+        await vector_store.persist()
 
-    async def process_document(self, file_path: str, vector_store) -> None:
-        """Process a single document"""
+    async def process_document(self, file_path: str, vector_store, force: bool = False, persist: bool = True) -> None:
+        """Process a single document, replacing the vectors of any earlier version of it.
+        
+        With ``persist`` False the in-memory index state is left for the caller to save.
+        """
+        started = time.perf_counter()
         try:
             filename = os.path.basename(file_path)
             file_ext = os.path.splitext(filename)[1].lower()
             file_size = os.path.getsize(file_path)
             
             # Generate file hash for duplicate detection
-            file_hash = self._generate_file_hash(file_path)
+            file_hash = await run_io(self._generate_file_hash, file_path)
             
             # Check if already processed
-            if self._doc_exists(file_hash):
+            if self._doc_exists(file_hash) and not force:
                 print(f"Document {filename} already processed, skipping...")
+                ingested_documents.inc(status="unchanged")
                 return
             
             print(f"Processing {filename}...")
             
-            # Extract text based on file type
-            if file_ext == '.pdf':
-                text_content = self._extract_pdf_text(file_path)
-            elif file_ext == '.docx':
-                text_content = self._extract_docx_text(file_path)
-            elif file_ext == '.csv':
-                text_content = self._extract_csv_text(file_path)
-            elif file_ext == '.md':
-                text_content = self._extract_markdown_text(file_path)
-            elif file_ext == '.html':
-                text_content = self._extract_html_text(file_path)
-            elif file_ext == '.txt':
-                text_content = self._extract_txt_text(file_path)
-            else:
+            # Re-ingesting replaces all of the file's vectors, including ones written
+            # for the same content with an older metadata version or chunk ID scheme
+            replaced_hashes = self._doc_hashes(filename)
+            if replaced_hashes:
+                await vector_store.delete_by_source(filename)
+                for doc_hash in replaced_hashes:
+                    del self.docs_indexed[doc_hash]
+            
+            if file_ext not in self.supported_extensions:
                 print(f"Unsupported file type: {file_ext}")
+                ingested_documents.inc(status="unsupported")
                 return
             
-            if not text_content:
+            # Extract and chunk the text in a worker process
+            chunks = await run_cpu(extract_chunks, file_path, file_ext)
+            
+            if not chunks:
                 print(f"No text extracted from {filename}")
+                ingested_documents.inc(status="empty")
                 return
             
-            # Chunk the text
-            chunks = self._chunk_text(text_content)
+            # Tag every chunk with its language and count its lexical index terms in one batched pass
+            languages, term_counts = await run_cpu(analyze_chunks, chunks)
             
-            # Generate embeddings and store in vector database
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{filename}_chunk_{i}"
-                
-                # Generate embedding
-                embedding = await self.embedding_generator.generate_embedding(chunk)
-                
-                # Store in vector database
-                metadata = {
-                    "filename": filename,
-                    "chunk_id": chunk_id,
-                    "chunk_index": i,
-                    "file_type": file_ext,
-                    "text": chunk
-                }
-                
-                await vector_store.add_document(chunk_id, embedding, metadata)
+            # Embed and store chunks in bulk, one flush per buffer of chunks
+            for start in range(0, len(chunks), self.flush_size):
+                end = start + self.flush_size
+                await self._flush_chunks(chunks[start:end], languages[start:end], term_counts[start:end], start, filename, file_ext, file_hash, vector_store)
             
             # Record processed document
             doc_metadata = {
@@ -138,15 +202,23 @@ class DocumentProcessor:
                 "file_type": file_ext,
                 "file_size": file_size,
                 "chunk_count": len(chunks),
+                "languages": sorted(set(languages)),
+                "metadata_version": CHUNK_METADATA_VERSION,
                 "indexed_at": datetime.utcnow().isoformat(),
                 "status": "indexed"
             }
             
-            self._add_processed_doc(file_hash, doc_metadata)
+            await run_io(self._add_processed_doc, file_hash, doc_metadata)
+            if persist:
+                await vector_store.persist()
             print(f"Successfully processed {filename} with {len(chunks)} chunks")
+            ingested_documents.inc(status="indexed")
+            ingested_chunks.inc(len(chunks))
+            ingest_seconds.observe(time.perf_counter() - started, file_type=file_ext)
             
         except Exception as e:
             print(f"Error processing {file_path}: {e}")
+            ingested_documents.inc(status="error")
             
             # Record error
             error_metadata = {
@@ -158,9 +230,50 @@ class DocumentProcessor:
                 "error_message": str(e)
             }
             
-            self._add_processed_doc(self._generate_file_hash(file_path), error_metadata)
+            error_hash = await run_io(self._generate_file_hash, file_path)
+            await run_io(self._add_processed_doc, error_hash, error_metadata)
+
+    async def _flush_chunks(self, chunks: List[str], languages: List[str], term_counts: List[Dict[str, int]], first_index: int, filename: str, file_ext: str, file_hash: str, vector_store) -> None:
+        """Embed a buffer of chunks in one batch and write it with one bulk upsert"""
+        # Unchanged chunks come from the embedding cache
+        embeddings = await self.embedding_generator.generate_embeddings_batch(chunks)
+        
+        ids = []
+        metadatas = []
+        for i, (chunk, language) in enumerate(zip(chunks, languages), start=first_index):
+            chunk_id = self._chunk_id(file_hash, i, chunk)
+            ids.append(chunk_id)
+            metadatas.append({
+                "filename": filename,
+                "chunk_id": chunk_id,
+                "chunk_index": i,
+                "file_type": file_ext,
+                "file_hash": file_hash,
+                "language": language,
+                "text": chunk
+            })
+        
+        await vector_store.add_documents(ids, embeddings, chunks, metadatas, term_counts=term_counts)
+
+    @staticmethod
+    def _extract_text(file_path: str, file_ext: str) -> str:
+        """Extract text based on file type"""
+        if file_ext == '.pdf':
+            return DocumentProcessor._extract_pdf_text(file_path)
+        elif file_ext == '.docx':
+            return DocumentProcessor._extract_docx_text(file_path)
+        elif file_ext == '.csv':
+            return DocumentProcessor._extract_csv_text(file_path)
+        elif file_ext == '.md':
+            return DocumentProcessor._extract_markdown_text(file_path)
+        elif file_ext == '.html':
+            return DocumentProcessor._extract_html_text(file_path)
+        elif file_ext == '.txt':
+            return DocumentProcessor._extract_txt_text(file_path)
+        return ""
 
-    def _extract_pdf_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_pdf_text(file_path: str) -> str:
         """Extract text from PDF file"""
         try:
             text = ""
@@ -173,7 +286,8 @@ class DocumentProcessor:
             print(f"Error extracting PDF text: {e}")
             return ""
 
-    def _extract_docx_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_docx_text(file_path: str) -> str:
         """Extract text from DOCX file"""
         try:
             doc = docx.Document(file_path)
@@ -185,7 +299,8 @@ class DocumentProcessor:
             print(f"Error extracting DOCX text: {e}")
             return ""
 
-    def _extract_csv_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_csv_text(file_path: str) -> str:
         """Extract text from CSV file"""
         try:
             df = pd.read_csv(file_path)
@@ -196,7 +311,8 @@ class DocumentProcessor:
             print(f"Error extracting CSV text: {e}")
             return ""
 
-    def _extract_markdown_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_markdown_text(file_path: str) -> str:
         """Extract text from Markdown file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
@@ -209,7 +325,8 @@ class DocumentProcessor:
             print(f"Error extracting Markdown text: {e}")
             return ""
 
-    def _extract_html_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_html_text(file_path: str) -> str:
         """Extract text from HTML file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
@@ -220,7 +337,8 @@ class DocumentProcessor:
             print(f"Error extracting HTML text: {e}")
             return ""
 
-    def _extract_txt_text(self, file_path: str) -> str:
+    @staticmethod
+    def _extract_txt_text(file_path: str) -> str:
         """Extract text from TXT file"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
@@ -229,7 +347,8 @@ class DocumentProcessor:
             print(f"Error extracting TXT text: {e}")
             return ""
 
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    @staticmethod
+    def _chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Split text into overlapping chunks"""
         if len(text) <= chunk_size:
             return [text]
@@ -244,7 +363,8 @@ class DocumentProcessor:
             if end < len(text):
                 # Look for sentence ending
                 sentence_end = text.rfind('.', start, end)
-                if sentence_end > start:
+                # A boundary inside the overlap would stop the window from advancing
+                if sentence_end > start + overlap:
                     end = sentence_end + 1
             
             chunk = text[start:end].strip()
@@ -258,10 +378,30 @@ class DocumentProcessor:
         
         return chunks
 
-    def _generate_file_hash(self, file_path: str) -> str:
+    def _chunk_id(self, file_hash: str, chunk_index: int, chunk: str) -> str:
+        """Stable chunk ID derived from the file content, chunk position and chunk content"""
+        chunk_hash = hashlib.md5(chunk.encode()).hexdigest()[:12]
+        return f"{file_hash}_{chunk_index}_{chunk_hash}"
+
+    @staticmethod
+    def _generate_file_hash(file_path: str) -> str:
         """Generate MD5 hash of file for duplicate detection"""
         hash_md5 = hashlib.md5()
         with open(file_path, "rb") as f:
             for chunk in iter(lambda: f.read(4096), b""):
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
+
+
+def extract_chunks(file_path: str, file_ext: str) -> List[str]:
+    """Extract and chunk a document; module-level so it can run in a worker process"""
+    text_content = DocumentProcessor._extract_text(file_path, file_ext)
+    if not text_content:
+        return []
+    return DocumentProcessor._chunk_text(text_content)
+
+
+def analyze_chunks(chunks: List[str]) -> Tuple[List[str], List[Dict[str, int]]]:
+    """Language and lexical index term counts of each chunk; module-level so it can run in a worker process"""
+    detector = LanguageDetector()
+    return [detector.detect_language(chunk) for chunk in chunks], count_terms(chunks)
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EmbeddingBatcher:
+    """Collects single-text embedding requests from concurrent callers into batches.
+
+    A batch is flushed when it reaches ``max_batch_size`` texts or when the
+    oldest queued text has waited ``max_wait_ms``, whichever comes first, and
+    is embedded with one call to ``embed_fn``.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Awaitable[np.ndarray]], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The event loop only keeps weak references to tasks; running batches are held here
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+        # Batch statistics
+        self.batch_count = 0
+        self.text_count = 0
+        self.histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.histogram_overflow = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Queue a text and wait for its embedding from the next batch"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Hand the queued texts to a batch task"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._record_batch(len(batch))
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Embed one batch and resolve the waiting callers"""
+        try:
+            vectors = await self.embed_fn([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def _record_batch(self, size: int) -> None:
+        self.batch_count += 1
+        self.text_count += size
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self.histogram[bucket] += 1
+                return
+        self.histogram_overflow += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get batch-size statistics for tuning max batch size and max wait"""
+        histogram = {str(bucket): count for bucket, count in self.histogram.items()}
+        histogram[f">{BATCH_SIZE_BUCKETS[-1]}"] = self.histogram_overflow
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batch_count,
+            'texts': self.text_count,
+            'avg_batch_size': self.text_count / self.batch_count if self.batch_count else 0.0,
+            'queued': len(self._pending),
+            'batch_size_histogram': histogram
+        }
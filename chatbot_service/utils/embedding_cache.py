@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-memory LRU tier and a persistent SQLite tier.
+
+    Keys hash the model namespace (name, version and dimension) together with
+    the normalized text, so vectors from a different model are never reused.
+    """
+
+    def __init__(self, namespace: str, dimension: int, max_entries: int = 10000, db_path: Optional[str] = "embedding_cache.sqlite3"):
+        self.namespace = namespace
+        self.dimension = dimension
+        self.max_entries = max(0, max_entries)
+        self.db_path = db_path or None
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        # Cache statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.db_path:
+            try:
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                print(f"Embedding disk cache disabled: {e}")
+                self._db = None
+
+    def make_key(self, normalized_text: str) -> str:
+        """Build the cache key for an already normalized text"""
+        return hashlib.sha256(f"{self.namespace}\0{normalized_text}".encode()).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Look up keys in memory first, then on disk; disk hits are promoted to memory"""
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    block = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(block))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", block
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        if vector.shape[0] != self.dimension:
+                            continue
+                        found[key] = vector
+                        self.disk_hits += 1
+                        self._remember(key, vector)
+
+            self.misses += sum(1 for key in missing if key not in found)
+
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Store vectors in both tiers"""
+        if not items:
+            return
+
+        with self._lock:
+            rows = []
+            for key, vector in items.items():
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, vector.tobytes()))
+
+            if self._db is not None:
+                try:
+                    self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                    self._db.commit()
+                except Exception as e:
+                    print(f"Error writing embedding disk cache: {e}")
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert into the LRU tier, evicting the least recently used entries"""
+        if self.max_entries == 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached vector from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit, miss and eviction counters"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'namespace': self.namespace,
+            'memory_entries': len(self._memory),
+            'max_memory_entries': self.max_entries,
+            'disk_path': self.db_path if self._db is not None else None,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
@@ -1,72 +1,243 @@
 import asyncio
-from typing import List
+from typing import Any, Dict, List, Optional
 import hashlib
 import json
+import os
 
-class EmbeddingGenerator:
-    def __init__(self, model_name: str = "simple-hash-embedding"):
-        """Initialize embedding generator with simple hash-based approach"""
+import numpy as np
+
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .executors import run_cpu_blocking, run_io
+from .single_flight import SingleFlight
+
+# Residues of 2**96, 2**64, 2**32 and 1 modulo 2,000,000. An MD5 digest read as
+# four big-endian 32-bit words can be reduced with these without ever building
+# the 128-bit integer.
+_HASH_MODULUS = 2000000
+_WORD_RESIDUES = np.array(
+    [pow(2, 32 * (3 - k), _HASH_MODULUS) for k in range(4)], dtype=np.uint64
+)
+_HASH_BLOCK_SIZE = 256
+
+# Below this many characters a batch is embedded in the calling thread, since
+# shipping it to a worker process would cost more than hashing it
+_PROCESS_OFFLOAD_MIN_CHARS = 20000
+
+
+def hash_embeddings_batch(texts: List[str], dimension: int = 384) -> np.ndarray:
+    """Embed a list of texts into a contiguous float32 matrix of shape (len(texts), dimension).
+
+    Produces the same vectors as the original per-dimension hash scheme: for
+    every group ``i`` the digests of ``text + i``, ``text + i + i``,
+    ``reversed(text) + i + i`` and ``sorted(text) + i + i`` are reduced modulo
+    2,000,000 and scaled to [-1, 1]. The shared prefixes are hashed once per
+    text and cloned, so the cost no longer grows with text length times dimension.
+    """
+    groups = dimension // 4
+    matrix = np.zeros((len(texts), dimension), dtype=np.float32)
+    if not texts or groups == 0:
+        return matrix
+
+    suffixes = [(str(i).encode(), (str(i) * 2).encode()) for i in range(groups)]
+
+    # Reduce digests block by block so the intermediate bytes stay cache-sized
+    for block_start in range(0, len(texts), _HASH_BLOCK_SIZE):
+        block = texts[block_start:block_start + _HASH_BLOCK_SIZE]
+        digests = []
+        append = digests.append
+
+        for text in block:
+            text = text.lower().strip()
+            forward = hashlib.md5(text.encode())
+            reverse = hashlib.md5(text[::-1].encode())
+            ordered = hashlib.md5(''.join(sorted(text)).encode())
+
+            for once, twice in suffixes:
+                # text + i + i continues the text + i state instead of rehashing it
+                h = forward.copy()
+                h.update(once)
+                append(h.digest())
+                h.update(once)
+                append(h.digest())
+                h = reverse.copy()
+                h.update(twice)
+                append(h.digest())
+                h = ordered.copy()
+                h.update(twice)
+                append(h.digest())
+
+        words = np.frombuffer(b''.join(digests), dtype='>u4').astype(np.uint64).reshape(-1, 4)
+        residues = (words * _WORD_RESIDUES).sum(axis=1) % _HASH_MODULUS
+        matrix[block_start:block_start + len(block), :groups * 4] = (
+            residues.astype(np.float64) / 1000000 - 1
+        ).reshape(len(block), groups * 4)
+
+    return matrix
+
+
+class HashEmbeddingBackend:
+    """Deterministic hash-based embeddings with no model weights, used for development and tests"""
+
+    # Pure-Python hashing holds the GIL, so large batches run in worker processes
+    offload_to_process = True
+
+    def __init__(self, model_name: str = "simple-hash-embedding", dimension: int = 384):
+        self.model_name = model_name
+        self.model_version = "1"
+        self.dimension = dimension
+
+    def normalize_text(self, text: str) -> str:
+        """Normalize text the same way the hash scheme does, so equal keys mean equal vectors"""
+        return text.lower().strip()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 matrix"""
+        return hash_embeddings_batch(texts, self.dimension)
+
+
+class SentenceTransformerBackend:
+    """Local CPU embedding model loaded once through sentence-transformers (PyTorch or ONNX runtime)"""
+
+    # The model releases the GIL during inference and is too large to copy into workers
+    offload_to_process = False
+
+    def __init__(self, model_name: str = "paraphrase-multilingual-MiniLM-L12-v2", device: str = "cpu", runtime: str = "torch"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("sentence-transformers is not installed; install it or set EMBEDDING_BACKEND=hash") from e
+
+        kwargs = {'device': device}
+        if runtime == 'onnx':
+            kwargs['backend'] = 'onnx'
+
+        self.model = SentenceTransformer(model_name, **kwargs)
         self.model_name = model_name
-        self.dimension = 384  # Standard embedding dimension
-        print(f"Using simple hash-based embeddings: {self.model_name}")
+        self.model_version = f"{runtime}-{self.model.get_sentence_embedding_dimension()}"
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def normalize_text(self, text: str) -> str:
+        """Collapse whitespace, which the model tokenizer ignores anyway"""
+        return " ".join(text.split())
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a float32 matrix with one forward pass per batch"""
+        embeddings = self.model.encode(
+            texts,
+            batch_size=max(1, len(texts)),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+def create_embedding_backend(backend_name: Optional[str] = None, model_name: Optional[str] = None):
+    """Create the embedding backend selected by EMBEDDING_BACKEND (hash, sentence-transformers or onnx)"""
+    backend_name = (backend_name or os.getenv("EMBEDDING_BACKEND", "hash")).lower()
+    model_name = model_name or os.getenv("EMBEDDING_MODEL_NAME")
+
+    if backend_name == "hash":
+        return HashEmbeddingBackend(model_name or "simple-hash-embedding")
+    if backend_name in ("sentence-transformers", "onnx"):
+        return SentenceTransformerBackend(
+            model_name or "paraphrase-multilingual-MiniLM-L12-v2",
+            device=os.getenv("EMBEDDING_DEVICE", "cpu"),
+            runtime="onnx" if backend_name == "onnx" else "torch"
+        )
+    raise ValueError(f"Unknown embedding backend: {backend_name}")
+
+
+class EmbeddingGenerator:
+    def __init__(self, model_name: Optional[str] = None, backend=None):
+        """Initialize embedding generator on the configured backend"""
+        self.backend = backend or create_embedding_backend(model_name=model_name)
+        self.model_name = self.backend.model_name
+        self.dimension = self.backend.dimension
+
+        # Single-text requests from concurrent callers share batched forward passes
+        self.batcher = EmbeddingBatcher(
+            self._embed_texts,
+            max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+        )
+
+        # Identical texts requested concurrently share one embedding
+        self.single_flight = SingleFlight()
+
+        # Model version is part of every key so a model change never reuses old vectors
+        self.cache = EmbeddingCache(
+            namespace=f"{self.model_name}@{self.backend.model_version}/{self.dimension}",
+            dimension=self.dimension,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            db_path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+        )
+        print(f"Using embedding backend: {self.model_name}")
 
     async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text using hash-based approach"""
+        """Generate embedding for a single text through the cache and batching queue"""
         try:
-            # Simple hash-based embedding for development
-            # In production, replace with actual sentence-transformers
-            return self._hash_to_embedding(text)
+            key = self.cache.make_key(self.backend.normalize_text(text))
+            return await self.single_flight.do(key, lambda: self._embed_one(text, key))
             
         except Exception as e:
             print(f"Error generating embedding: {e}")
             # Return zero vector as fallback
             return [0.0] * self.dimension
 
-    def _hash_to_embedding(self, text: str) -> List[float]:
-        """Convert text to embedding using hash functions"""
-        # Normalize text
-        text = text.lower().strip()
-        
-        # Generate multiple hashes to create embedding
-        embeddings = []
-        
-        # Use different hash functions and seeds
-        for i in range(self.dimension // 4):
-            # Create different variations of the text
-            variations = [
-                text,
-                text + str(i),
-                text[::-1] + str(i),  # Reversed text
-                ''.join(sorted(text)) + str(i)  # Sorted characters
-            ]
-            
-            for variation in variations:
-                hash_obj = hashlib.md5((variation + str(i)).encode())
-                hash_int = int(hash_obj.hexdigest(), 16)
-                # Normalize to [-1, 1] range
-                normalized = (hash_int % 2000000) / 1000000 - 1
-                embeddings.append(normalized)
-                
-                if len(embeddings) >= self.dimension:
-                    break
-            
-            if len(embeddings) >= self.dimension:
-                break
+    async def _embed_one(self, text: str, key: str) -> List[float]:
+        """Embed one text through the cache and batching queue"""
+        cached = await run_io(self.cache.get_many, [key])
+        if key in cached:
+            return cached[key].tolist()
+
+        embedding = await self.batcher.embed(text)
+        await run_io(self.cache.put_many, {key: embedding})
+        return embedding.tolist()
+
+    async def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Run one batched forward pass for the batcher off the event loop"""
+        return await run_io(self._compute_embeddings, texts)
+
+    def _compute_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, in a worker process when the backend is CPU-bound and the batch is large.
         
-        # Ensure we have exactly the right dimension
-        while len(embeddings) < self.dimension:
-            embeddings.append(0.0)
+        Blocks, so it must run on an executor thread rather than the event loop.
+        """
+        if self.backend.offload_to_process and sum(len(text) for text in texts) >= _PROCESS_OFFLOAD_MIN_CHARS:
+            return run_cpu_blocking(self.backend.embed, texts)
+        return self.backend.embed(texts)
+
+    def generate_embeddings_matrix(self, texts: List[str]) -> np.ndarray:
+        """Generate a float32 embedding matrix for multiple texts, embedding only cache misses.
         
-        return embeddings[:self.dimension]
+        Blocking; async callers should use generate_embeddings_batch.
+        """
+        keys = [self.cache.make_key(self.backend.normalize_text(text)) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Identical texts within the batch are embedded once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            computed = dict(zip(missing.keys(), self._compute_embeddings(list(missing.values()))))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        matrix = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, key in enumerate(keys):
+            matrix[i] = found[key]
+        return matrix
 
     async def generate_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Generate embeddings for multiple texts"""
         try:
-            embeddings = []
-            for text in texts:
-                embedding = await self.generate_embedding(text)
-                embeddings.append(embedding)
-            return embeddings
+            matrix = await run_io(self.generate_embeddings_matrix, texts)
+            return matrix.tolist()
             
         except Exception as e:
             print(f"Error generating batch embeddings: {e}")
@@ -76,3 +247,26 @@ class EmbeddingGenerator:
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings"""
         return self.dimension
+
+    def get_batching_stats(self) -> Dict[str, Any]:
+        """Get batch-size statistics of the query batching queue"""
+        return self.batcher.get_stats()
+
+    def get_single_flight_stats(self) -> Dict[str, Any]:
+        """Get how many query embeddings were shared between concurrent callers"""
+        return self.single_flight.get_stats()
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get hit, miss and eviction counters of the embedding cache"""
+        return self.cache.get_stats()
+
+
+_shared_generator: Optional[EmbeddingGenerator] = None
+
+
+def get_embedding_generator() -> EmbeddingGenerator:
+    """Get the process-wide embedding generator so concurrent queries share one model and queue"""
+    global _shared_generator
+    if _shared_generator is None:
+        _shared_generator = EmbeddingGenerator()
+    return _shared_generator
@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor: Optional[Executor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool for blocking I/O: Chroma calls, file reads and hashing, SQLite"""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(
+            max_workers=max(1, int(os.getenv("IO_EXECUTOR_WORKERS", "8"))),
+            thread_name_prefix="chatbot-io"
+        )
+    return _io_executor
+
+
+def get_cpu_executor() -> Executor:
+    """Process pool for CPU-bound work such as text extraction and hash embeddings.
+
+    CPU_EXECUTOR_WORKERS=0 runs that work on the I/O thread pool instead, for
+    environments where worker processes are not available. Even on one core a
+    worker process is preferable, because the OS preempts it while a thread
+    holding the GIL starves the event loop.
+    """
+    global _cpu_executor
+    if _cpu_executor is None:
+        # One core is left to the event loop by default
+        workers = int(os.getenv("CPU_EXECUTOR_WORKERS", str(max(1, (os.cpu_count() or 1) - 1))))
+        if workers <= 0:
+            _cpu_executor = get_io_executor()
+        else:
+            # spawn, because forking a process that already runs Chroma and pool threads is unsafe
+            _cpu_executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    return _cpu_executor
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking I/O call on the thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a CPU-bound call in a worker process; func and its arguments must be picklable"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(func, *args, **kwargs))
+
+
+def run_cpu_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a CPU-bound call in a worker process from a thread that may block"""
+    return get_cpu_executor().submit(func, *args, **kwargs).result()
+
+
+def shutdown_executors() -> None:
+    """Shut the pools down, e.g. on application shutdown"""
+    global _io_executor, _cpu_executor
+    if _cpu_executor is not None and _cpu_executor is not _io_executor:
+        _cpu_executor.shutdown(wait=False, cancel_futures=True)
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=False, cancel_futures=True)
+    _io_executor = None
+    _cpu_executor = None
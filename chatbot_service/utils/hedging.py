@@ -0,0 +1,90 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """Sends a duplicate of a slow call and takes whichever answer comes first.
+
+    Latencies of successful calls are tracked per kind of call. Once
+    ``min_samples`` are known, a call still running after the ``quantile``
+    latency of its kind (at least ``min_delay_ms``) gets one hedged duplicate;
+    the loser is cancelled.
+    """
+
+    def __init__(self, quantile: float = 0.95, min_samples: int = 20, min_delay_ms: float = 50.0, window: int = 200):
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay_ms / 1000
+        self.window = window
+
+        self._latencies: Dict[str, Deque[float]] = {}
+
+        # Hedging statistics, per kind of call
+        self.calls: Dict[str, int] = {}
+        self.hedges_sent: Dict[str, int] = {}
+        self.hedges_won: Dict[str, int] = {}
+
+    def delay(self, kind: str) -> Optional[float]:
+        """Seconds to wait before hedging a call of this kind, or None while there is too little data"""
+        latencies = self._latencies.get(kind)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))])
+
+    def record(self, kind: str, seconds: float) -> None:
+        self._latencies.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    async def run(self, kind: str, attempt: Callable[[], Awaitable[T]], can_hedge: Callable[[], bool] = lambda: True) -> T:
+        """Run attempt(), starting a second attempt if the first is slower than the hedge delay"""
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+
+        async def timed() -> T:
+            started = time.monotonic()
+            result = await attempt()
+            self.record(kind, time.monotonic() - started)
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        hedge = None
+        try:
+            delay = self.delay(kind)
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                if not done and can_hedge():
+                    hedge = asyncio.ensure_future(timed())
+                    pending.add(hedge)
+                    self.hedges_sent[kind] = self.hedges_sent.get(kind, 0) + 1
+                pending |= done
+
+            # First success wins; the call only fails if every attempt failed
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won[kind] = self.hedges_won.get(kind, 0) + 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hedge delays and how often hedges were sent and won, per kind of call"""
+        return {
+            kind: {
+                'calls': calls,
+                'hedge_delay_ms': self.delay(kind) * 1000 if self.delay(kind) is not None else None,
+                'hedges_sent': self.hedges_sent.get(kind, 0),
+                'hedges_won': self.hedges_won.get(kind, 0)
+            }
+            for kind, calls in self.calls.items()
+        }
@@ -1,11 +1,37 @@
-from langdetect import detect
+from collections import OrderedDict
+from langdetect import DetectorFactory, detect
 from langdetect.lang_detect_exception import LangDetectException
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+
+# langdetect samples randomly; a fixed seed makes the same text always get the same answer
+DetectorFactory.seed = 0
+
+# Arabic, Arabic Supplement and the Arabic presentation forms
+_ARABIC_RANGES = ((0x0600, 0x06FF), (0x0750, 0x077F), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF))
+
+
+def _is_arabic_letter(code: int) -> bool:
+    return any(low <= code <= high for low, high in _ARABIC_RANGES)
+
 
 class LanguageDetector:
-    def __init__(self):
+    """Tiered en/ar detection.
+    
+    Counting Arabic-script and Latin letters in one pass decides nearly every
+    message in microseconds. Only when neither script clearly dominates is
+    langdetect asked, and those answers are cached since they are the slow ones.
+    """
+    
+    def __init__(self, script_margin: float = 0.2, cache_size: int = 10000):
         self.supported_languages = {'en', 'ar'}
         self.default_language = 'en'
+        # A script owning all but this share of the letters decides the language on its own
+        self.script_margin = script_margin
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        
+        # Detection statistics, per tier
+        self.counts = {'script': 0, 'langdetect': 0, 'cache': 0, 'default': 0}
     
     def detect_language(self, text: str) -> str:
         """Detect language of the input text"""
@@ -14,25 +40,77 @@ class LanguageDetector:
             cleaned_text = self._clean_text(text)
             
             if not cleaned_text:
+                self.counts['default'] += 1
                 return self.default_language
             
-            # Detect language
-            detected = detect(cleaned_text)
-            
-            # Map detected language to supported languages
-            if detected in self.supported_languages:
-                return detected
-            else:
-                # Default fallback
+            arabic, latin = self.score_scripts(cleaned_text)
+            letters = arabic + latin
+            if letters == 0:
+                self.counts['default'] += 1
                 return self.default_language
+            
+            arabic_share = arabic / letters
+            if arabic_share >= 1 - self.script_margin:
+                self.counts['script'] += 1
+                return 'ar'
+            if arabic_share <= self.script_margin:
+                self.counts['script'] += 1
+                return 'en'
+            
+            # Mixed scripts: ask langdetect, once per distinct text
+            cached = self._cache.get(cleaned_text)
+            if cached is not None:
+                self._cache.move_to_end(cleaned_text)
+                self.counts['cache'] += 1
+                return cached
+            
+            self.counts['langdetect'] += 1
+            detected = self._detect_ambiguous(cleaned_text, arabic_share)
+            self._cache[cleaned_text] = detected
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return detected
                 
-        except LangDetectException:
-            # If detection fails, return default
-            return self.default_language
         except Exception as e:
             print(f"Language detection error: {e}")
             return self.default_language
     
+    def _detect_ambiguous(self, text: str, arabic_share: float) -> str:
+        """langdetect for mixed-script text, falling back to the majority script"""
+        try:
+            detected = detect(text)
+            # Map detected language to supported languages
+            if detected in self.supported_languages:
+                return detected
+        except LangDetectException:
+            pass
+        return 'ar' if arabic_share > 0.5 else 'en'
+    
+    @staticmethod
+    def score_scripts(text: str) -> Tuple[int, int]:
+        """Count Arabic-script and Latin letters in one pass"""
+        arabic = latin = 0
+        for char in text:
+            code = ord(char)
+            if code < 128:
+                if char.isalpha():
+                    latin += 1
+            elif 0x0600 <= code <= 0xFEFF and _is_arabic_letter(code) and char.isalpha():
+                arabic += 1
+            elif code < 0x0250 and char.isalpha():
+                # Latin-1 and Latin Extended letters
+                latin += 1
+        return arabic, latin
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get how many detections each tier answered"""
+        total = sum(self.counts.values())
+        return {
+            **self.counts,
+            'script_ratio': self.counts['script'] / total if total else 0.0,
+            'cache_entries': len(self._cache)
+        }
+    
     def _clean_text(self, text: str) -> str:
         """Clean text for better language detection"""
         if not text:
@@ -0,0 +1,164 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+
+class LLMOverloadedError(Exception):
+    """Raised when an LLM call cannot be admitted; retry_after is a suggested wait in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second on average, with bursts of up to ``burst``"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def seconds_until_token(self) -> float:
+        """Time until one token is available, 0 if one is available now"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the time slept"""
+        slept = 0.0
+        while True:
+            delay = self.seconds_until_token()
+            if delay <= 0:
+                self.tokens -= 1
+                return slept
+            await asyncio.sleep(delay)
+            slept += delay
+
+
+class LLMLimiter:
+    """Admission control for LLM calls.
+
+    At most ``max_concurrency`` calls run at once and, when ``rate`` is set,
+    no more than ``rate`` start per second (token bucket with ``burst``).
+    Calls beyond that wait in a queue of at most ``max_queue`` callers for up
+    to ``queue_timeout`` seconds; a full queue or an expired wait raises
+    LLMOverloadedError instead of piling more load onto the provider.
+    """
+
+    def __init__(self, max_concurrency: int = 20, max_queue: int = 100, queue_timeout: float = 10.0, rate: float = 0.0, burst: int = 10):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.active = 0
+        self.waiting = 0
+
+        # Admission statistics
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rate_limited = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.total_call_time = 0.0
+        self.calls_finished = 0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+
+    def retry_after(self) -> int:
+        """Suggested seconds before a rejected caller retries: roughly the time to drain the queue"""
+        avg_call = self.total_call_time / self.calls_finished if self.calls_finished else 1.0
+        drain = avg_call * (self.waiting + 1) / self.max_concurrency
+        if self.bucket is not None:
+            drain = max(drain, (self.waiting + 1) / self.bucket.rate)
+        return max(1, math.ceil(drain))
+
+    def admit(self) -> None:
+        """Reject up front when the wait queue is already full"""
+        if self.waiting >= self.max_queue and self.is_saturated():
+            self.rejected_queue_full += 1
+            raise LLMOverloadedError("LLM wait queue is full", self.retry_after())
+
+    def is_saturated(self) -> bool:
+        """Whether a new call would have to wait"""
+        if self._semaphore.locked():
+            return True
+        return self.bucket is not None and self.bucket.seconds_until_token() > 0
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold one LLM call slot for the duration of the block.
+        
+        ``timeout`` shortens the queue wait, e.g. to the time left before a request deadline.
+        """
+        self.admit()
+
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.waiting)
+        started = time.monotonic()
+        acquired = False
+        try:
+            wait_limit = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+            async with asyncio.timeout(wait_limit):
+                await self._semaphore.acquire()
+                acquired = True
+                if self.bucket is not None and await self.bucket.acquire() > 0:
+                    self.rate_limited += 1
+        except TimeoutError:
+            if acquired:
+                self._semaphore.release()
+            self.rejected_timeout += 1
+            raise LLMOverloadedError("Timed out waiting for an LLM slot", self.retry_after()) from None
+        except BaseException:
+            if acquired:
+                self._semaphore.release()
+            raise
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - started
+        self.admitted += 1
+        self.total_wait += wait
+        self._recent_waits.append(wait)
+
+        self.active += 1
+        call_started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.calls_finished += 1
+            self.total_call_time += time.monotonic() - call_started
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth, wait times and rejections for sizing concurrency and queue limits"""
+        waits = sorted(self._recent_waits)
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'rate_per_second': self.bucket.rate if self.bucket else None,
+            'burst': self.bucket.burst if self.bucket else None,
+            'active': self.active,
+            'queue_depth': self.waiting,
+            'max_queue_depth': self.max_queue_depth,
+            'admitted': self.admitted,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+            'rate_limited': self.rate_limited,
+            'avg_wait_ms': self.total_wait / self.admitted * 1000 if self.admitted else 0.0,
+            'p95_wait_ms': waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+            'max_wait_ms': waits[-1] * 1000 if waits else 0.0,
+            'avg_call_ms': self.total_call_time / self.calls_finished * 1000 if self.calls_finished else 0.0
+        }
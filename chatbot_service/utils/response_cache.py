@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Answer cache keyed on query embeddings, for near-duplicate questions.
+
+    A lookup returns the stored answer of the most similar cached query in the
+    same language when their cosine similarity reaches ``threshold``. Entries
+    expire after ``ttl_seconds``, the least recently used entry is evicted
+    beyond ``max_entries``, and everything is dropped when the index version
+    changes, since answers built on the old content may be stale.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.index_version: Optional[Hashable] = None
+
+        # entry id -> (language, unit vector, response, stored at, LLM calls it cost)
+        self._entries: "OrderedDict[int, Tuple[str, np.ndarray, Dict[str, Any], float, int]]" = OrderedDict()
+        self._next_id = 0
+        # Per-language similarity matrices, rebuilt lazily after changes
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+        # Cache statistics
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_llm_calls = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    def _check_version(self, index_version: Hashable) -> None:
+        """Drop every entry when the searchable content has changed"""
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrices.clear()
+            self.index_version = index_version
+
+    def _matrix(self, language: str) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(language)
+        if cached is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry[0] == language]
+            vectors = np.stack([self._entries[entry_id][1] for entry_id in ids]) if ids else np.zeros((0, 0), dtype=np.float32)
+            cached = self._matrices[language] = (ids, vectors)
+        return cached
+
+    def _remove(self, entry_id: int) -> None:
+        language = self._entries.pop(entry_id)[0]
+        self._matrices.pop(language, None)
+
+    def get(self, vector: Sequence[float], language: str, index_version: Hashable) -> Optional[Dict[str, Any]]:
+        """Return a cached response for a similar enough query, or None"""
+        if self.max_entries == 0:
+            return None
+        unit = self._unit(vector)
+
+        with self._lock:
+            self._check_version(index_version)
+            ids, vectors = self._matrix(language)
+            if unit is not None and ids:
+                scores = vectors @ unit
+                # Best candidates first; expired ones are removed on the way
+                for position in np.argsort(-scores):
+                    if scores[position] < self.threshold:
+                        break
+                    entry_id = ids[position]
+                    _, _, response, stored_at, llm_calls = self._entries[entry_id]
+                    if time.monotonic() - stored_at > self.ttl_seconds:
+                        self._remove(entry_id)
+                        self.expirations += 1
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.saved_llm_calls += llm_calls
+                    return {**response, 'similarity': float(scores[position])}
+
+            self.misses += 1
+            return None
+
+    def put(self, vector: Sequence[float], language: str, index_version: Hashable, response: Dict[str, Any], llm_calls: int = 0) -> None:
+        """Store a response computed against ``index_version``"""
+        if self.max_entries == 0:
+            return
+        unit = self._unit(vector)
+        if unit is None:
+            return
+
+        with self._lock:
+            # An answer built on content that has since changed is not worth keeping
+            if index_version != self.index_version:
+                return
+            self._entries[self._next_id] = (language, unit, response, time.monotonic(), llm_calls)
+            self._next_id += 1
+            self._matrices.pop(language, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit ratio, evictions and the LLM calls hits have saved"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'saved_llm_calls': self.saved_llm_calls
+        }
@@ -0,0 +1,57 @@
+import re
+from collections import Counter
+from typing import Dict, List, Sequence
+
+# Arabic harakat, superscript alef and tatweel carry no meaning for matching
+_ARABIC_DIACRITICS = re.compile(r"[ً-ْٰـ]")
+_ARABIC_LETTER_VARIANTS = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ة": "ه",
+    "ى": "ي",
+})
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_ESTIMATE_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_ARABIC_ARTICLES = ("وال", "بال", "كال", "فال", "لل", "ال")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and fold Arabic spelling variants so equivalent words compare equal"""
+    text = _ARABIC_DIACRITICS.sub("", text.lower())
+    return text.translate(_ARABIC_LETTER_VARIANTS)
+
+
+def _strip_arabic_article(token: str) -> str:
+    """Drop a leading definite article, keeping at least a three-letter stem"""
+    for article in _ARABIC_ARTICLES:
+        if token.startswith(article) and len(token) - len(article) >= 3:
+            return token[len(article):]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Split English and Arabic text into normalized word tokens"""
+    return [_strip_arabic_article(token) for token in _TOKEN_PATTERN.findall(normalize_text(text))]
+
+
+def count_terms(texts: Sequence[str]) -> List[Dict[str, int]]:
+    """Token frequencies of each text, as indexed by the lexical index"""
+    return [dict(Counter(tokenize(text))) for text in texts]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap estimate of LLM subword tokens, without loading a model tokenizer.
+
+    Punctuation counts as one token and words as one token plus one per
+    further 8 characters. Non-Latin words split into more subwords, so those
+    count one token per 3 characters.
+    """
+    tokens = 0
+    for piece in _ESTIMATE_PATTERN.findall(text):
+        if piece.isascii():
+            tokens += 1 + len(piece) // 8
+        else:
+            tokens += 1 + len(piece) // 3
+    return tokens
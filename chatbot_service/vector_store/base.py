@@ -0,0 +1,324 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, Protocol, Sequence, Tuple, runtime_checkable
+import asyncio
+import json
+import os
+import time
+
+from utils.embeddings import EmbeddingGenerator, get_embedding_generator
+from utils.executors import run_io
+from utils.tokenizer import count_terms
+from vector_store.lexical_index import LexicalIndex
+
+# Generation pinned by the current request: (store id, generation, collection, lexical index)
+_pinned_collection: ContextVar[Optional[Tuple[int, int, Any, LexicalIndex]]] = ContextVar("pinned_collection", default=None)
+
+
+@runtime_checkable
+class VectorStore(Protocol):
+    """What the agent, the document processor and the API need from a vector store backend"""
+
+    collection_name: str
+    generation: int
+    embedding_generator: EmbeddingGenerator
+    content_version: int
+
+    @property
+    def index_version(self) -> Tuple[int, int]: ...
+
+    def pin_generation(self) -> ContextManager[int]: ...
+
+    def create_generation(self) -> "VectorStore": ...
+
+    async def activate_generation(self, shadow: "VectorStore") -> None: ...
+
+    async def add_documents(self, ids: List[str], embeddings: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]], batch_size: Optional[int] = None, term_counts: Optional[List[Dict[str, int]]] = None) -> None: ...
+
+    async def similarity_search(self, query: str, top_k: int = 5, where: Optional[Dict[str, Any]] = None, embedding: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]: ...
+
+    async def search_by_vector(self, embedding: Sequence[float], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]: ...
+
+    async def search_many(self, vectors: Sequence[Sequence[float]], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]: ...
+
+    async def delete_document(self, doc_id: str) -> bool: ...
+
+    async def delete_by_source(self, filename: str) -> int: ...
+
+    async def get_document_count(self) -> int: ...
+
+    async def get_all_documents(self) -> List[Dict[str, Any]]: ...
+
+    def clear_collection(self) -> None: ...
+
+    async def persist(self) -> None: ...
+
+    def get_collection_info(self) -> Dict[str, Any]: ...
+
+    def get_lexical_stats(self) -> Dict[str, Any]: ...
+
+
+class BaseVectorStore(ABC):
+    """Behaviour shared by the vector store backends.
+
+    ``collection_name`` is an alias for a series of versioned collections; the
+    active generation is read from the alias file in ``data_path`` unless one
+    is given. Requests pin the generation they started on, and searches fuse
+    vector results with the BM25 lexical index of the collection.
+
+    Backends provide the collection handling (``_open_collection``,
+    ``_collection_names``, ``_delete_collection``, ``_collection_count``,
+    ``_collection_pages``) and the reads and writes.
+    """
+
+    backend = ""
+
+    def __init__(self, collection_name: str, embedding_generator: Optional[EmbeddingGenerator], data_path: str, generation: Optional[int] = None):
+        self.collection_name = collection_name
+
+        # Long-lived embedder shared with the rest of the process unless one is injected
+        self.embedding_generator = embedding_generator or get_embedding_generator()
+
+        self.data_path = data_path
+        os.makedirs(self.data_path, exist_ok=True)
+        self.alias_file = os.path.join(self.data_path, "collection_aliases.json")
+
+        # In-flight readers per generation; a retired generation is dropped once idle
+        self._readers: Dict[int, int] = {}
+
+        self.generation = self._load_alias() if generation is None else generation
+        self.collection = self._open_collection(self._generation_name(self.generation))
+
+        # BM25 index over the chunk text of the active collection, fused with
+        # vector results by reciprocal rank fusion in similarity_search
+        self.lexical_search = os.getenv("LEXICAL_SEARCH", "true").lower() == "true"
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        self.lexical_index = self._open_lexical_index(self.collection)
+        self.fused_searches = 0
+        self.lexical_only_hits = 0
+
+        # Bumped on every write to the active collection, so caches of derived
+        # answers can tell when the indexed content has changed
+        self.content_version = 0
+
+    @abstractmethod
+    def _open_collection(self, name: str):
+        """Open a collection by name, creating it if needed"""
+
+    @abstractmethod
+    def _collection_names(self) -> List[str]:
+        """Names of every collection the backend holds"""
+
+    @abstractmethod
+    def _delete_collection(self, name: str) -> None:
+        """Drop a collection and its data"""
+
+    @abstractmethod
+    def _collection_count(self, collection) -> int:
+        """Number of documents in a collection"""
+
+    @abstractmethod
+    def _collection_pages(self, collection) -> Iterator[Tuple[List[str], List[str]]]:
+        """IDs and texts of every document, a page at a time"""
+
+    @abstractmethod
+    async def search_many(self, vectors: Sequence[Sequence[float]], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Nearest documents for each of several query vectors, in one call to the backend"""
+
+    @abstractmethod
+    async def _get_with_distance(self, ids: List[str], embedding: Sequence[float], where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch documents by ID with their distance to a query vector, keeping only those matching ``where``"""
+
+    @property
+    def index_version(self) -> Tuple[int, int]:
+        """Version of the searchable content: (generation, writes to that generation)"""
+        return self.generation, self.content_version
+
+    def _generation_name(self, generation: int) -> str:
+        """Collection name of a generation; generation 0 is the unversioned original"""
+        return self.collection_name if generation == 0 else f"{self.collection_name}__g{generation}"
+
+    def _lexical_file(self, name: str) -> str:
+        return os.path.join(self.data_path, "lexical", f"{name}.npz")
+
+    def _open_lexical_index(self, collection) -> LexicalIndex:
+        """Load the saved lexical index of a collection, rebuilding it when it is missing or out of date"""
+        index = LexicalIndex(
+            self._lexical_file(collection.name),
+            max_postings=int(os.getenv("LEXICAL_MAX_POSTINGS", "10000"))
+        )
+        try:
+            if index.load() and len(index) == self._collection_count(collection):
+                return index
+        except Exception as e:
+            print(f"Error loading lexical index of {collection.name}: {e}")
+
+        index.clear()
+        for ids, texts in self._collection_pages(collection):
+            index.add(ids, count_terms(texts))
+        if len(index):
+            index.write(index.snapshot())
+            print(f"Rebuilt lexical index of {collection.name}: {len(index)} chunks")
+        return index
+
+    async def persist(self) -> None:
+        """Save in-memory index state if it changed; file writes happen off the event loop"""
+        if self.lexical_index.dirty:
+            await run_io(self.lexical_index.write, self.lexical_index.snapshot())
+
+    def _load_alias(self) -> int:
+        """Read the active generation of this alias"""
+        try:
+            with open(self.alias_file, 'r') as f:
+                return int(json.load(f).get(self.collection_name, 0))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_alias(self, generation: int) -> None:
+        """Point the alias at a generation with an atomic file replace"""
+        aliases = {}
+        if os.path.exists(self.alias_file):
+            with open(self.alias_file, 'r') as f:
+                aliases = json.load(f)
+        aliases[self.collection_name] = generation
+
+        tmp_file = f"{self.alias_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(aliases, f, indent=2)
+        os.replace(tmp_file, self.alias_file)
+
+    def create_generation(self) -> "BaseVectorStore":
+        """Create an empty shadow collection for the next generation, bound to a new store"""
+        generation = self.generation + 1
+
+        # Leftovers of an earlier build that never went live
+        for name in self._collection_names():
+            if name.startswith(f"{self.collection_name}__g"):
+                suffix = name[len(self.collection_name) + 3:]
+                if suffix.isdigit() and int(suffix) > self.generation:
+                    self._delete_collection(name)
+
+        return type(self)(self.collection_name, self.embedding_generator, generation=generation)
+
+    async def activate_generation(self, shadow: "BaseVectorStore") -> None:
+        """Atomically switch the alias to a shadow generation and drop the old one once idle"""
+        old_generation, old_name = self.generation, self.collection.name
+
+        await run_io(self._save_alias, shadow.generation)
+        self.collection, self.generation = shadow.collection, shadow.generation
+        self.lexical_index = shadow.lexical_index
+        self.content_version = 0
+        print(f"Activated {self.backend} collection: {self.collection.name} (generation {self.generation})")
+
+        if old_name != self.collection.name:
+            await self._drop_generation(old_generation, old_name)
+
+    async def _drop_generation(self, generation: int, name: str, timeout: float = 60.0) -> None:
+        """Delete a retired generation after its in-flight readers have finished"""
+        deadline = time.monotonic() + timeout
+        while self._readers.get(generation) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        try:
+            await run_io(self._delete_collection, name)
+            lexical_file = self._lexical_file(name)
+            if os.path.exists(lexical_file):
+                os.remove(lexical_file)
+            print(f"Dropped retired {self.backend} collection: {name}")
+        except Exception as e:
+            print(f"Error dropping collection {name}: {e}")
+
+    @contextmanager
+    def pin_generation(self) -> Iterator[int]:
+        """Keep every read in this context on the generation that is active now"""
+        generation, collection, lexical_index = self.generation, self.collection, self.lexical_index
+        self._readers[generation] = self._readers.get(generation, 0) + 1
+        token = _pinned_collection.set((id(self), generation, collection, lexical_index))
+        try:
+            yield generation
+        finally:
+            _pinned_collection.reset(token)
+            self._readers[generation] -= 1
+
+    def _read_collection(self):
+        """Collection to read from: the pinned generation if any, else the active one"""
+        pinned = _pinned_collection.get()
+        if pinned is not None and pinned[0] == id(self):
+            return pinned[2]
+        return self.collection
+
+    def _read_lexical_index(self) -> LexicalIndex:
+        """Lexical index of the collection ``_read_collection`` returns"""
+        pinned = _pinned_collection.get()
+        if pinned is not None and pinned[0] == id(self):
+            return pinned[3]
+        return self.lexical_index
+
+    async def add_document(self, doc_id: str, embedding: List[float], metadata: Dict[str, Any]) -> None:
+        """Add a document to the vector store"""
+        await self.add_documents([doc_id], [embedding], [metadata.get("text", "")], [metadata])
+
+    async def similarity_search(self, query: str, top_k: int = 5, where: Optional[Dict[str, Any]] = None, embedding: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        """Search for similar documents, optionally restricted by a metadata filter such as {"language": "ar"}.
+
+        Vector and BM25 results are fused unless lexical search is disabled; a
+        precomputed query ``embedding`` skips re-embedding.
+        """
+        try:
+            # Generate query embedding
+            query_embedding = embedding if embedding is not None else await self.embedding_generator.generate_embedding(query)
+
+            if not self.lexical_search:
+                return await self.search_by_vector(query_embedding, top_k=top_k, where=where)
+            return await self._hybrid_search(query, query_embedding, top_k, where)
+
+        except Exception as e:
+            print(f"Error searching {self.backend}: {e}")
+            return []
+
+    async def _hybrid_search(self, query: str, embedding: Sequence[float], top_k: int, where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fuse vector and BM25 rankings with reciprocal rank fusion"""
+        depth = top_k * 2
+        vector_results = await self.search_by_vector(embedding, top_k=depth, where=where)
+        lexical_hits = self._read_lexical_index().search(query, top_k=depth)
+        self.fused_searches += 1
+
+        fused: Dict[str, float] = {}
+        for rank, result in enumerate(vector_results):
+            fused[result['id']] = fused.get(result['id'], 0.0) + 1 / (self.rrf_k + rank + 1)
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (self.rrf_k + rank + 1)
+
+        by_id = {result['id']: result for result in vector_results}
+        ranked = sorted(fused, key=fused.get, reverse=True)
+
+        # Lexical-only hits are fetched from the collection, which also applies the metadata filter.
+        # With a filter, every candidate is fetched before cutting to top_k, so hits that fail it
+        # make room for the next ones instead of shortening the results.
+        candidates = ranked if where else ranked[:top_k]
+        missing = [chunk_id for chunk_id in candidates if chunk_id not in by_id]
+        lexical_only = set()
+        if missing:
+            for result in await self._get_with_distance(missing, embedding, where):
+                by_id[result['id']] = result
+                lexical_only.add(result['id'])
+
+        best = [chunk_id for chunk_id in candidates if chunk_id in by_id][:top_k]
+        self.lexical_only_hits += len(lexical_only.intersection(best))
+        return [{**by_id[chunk_id], 'rrf_score': fused[chunk_id]} for chunk_id in best]
+
+    async def search_by_vector(self, embedding: Sequence[float], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search with a precomputed query vector, skipping re-embedding"""
+        results = await self.search_many([embedding], top_k=top_k, where=where)
+        return results[0] if results else []
+
+    def get_lexical_stats(self) -> Dict[str, Any]:
+        """Get lexical index size and how often fusion brought in chunks the vector search missed"""
+        return {
+            'enabled': self.lexical_search,
+            'rrf_k': self.rrf_k,
+            **self.lexical_index.get_stats(),
+            'fused_searches': self.fused_searches,
+            'lexical_only_hits': self.lexical_only_hits
+        }
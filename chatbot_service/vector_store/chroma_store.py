@@ -1,84 +1,176 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
-import uuid
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
 import os
 
-class ChromaStore:
-    def __init__(self, collection_name: str = "customer_support_docs"):
-        """Initialize ChromaDB connection"""
-        self.collection_name = collection_name
+import numpy as np
+
+from utils.embeddings import EmbeddingGenerator
+from utils.executors import run_io
+from utils.tokenizer import count_terms
+from vector_store.base import BaseVectorStore
+
+class ChromaStore(BaseVectorStore):
+    backend = "ChromaDB"
+
+    def __init__(self, collection_name: str = "customer_support_docs", embedding_generator: Optional[EmbeddingGenerator] = None, generation: Optional[int] = None):
+        """Initialize ChromaDB connection.
         
+        ``collection_name`` is an alias for a series of versioned collections. The
+        active generation is read from the alias file unless one is given.
+        """
         # Create ChromaDB client with persistent storage
-        self.chroma_path = os.path.join(os.getcwd(), "chroma_db")
-        os.makedirs(self.chroma_path, exist_ok=True)
+        chroma_path = os.path.join(os.getcwd(), "chroma_db")
+        os.makedirs(chroma_path, exist_ok=True)
+        self.client = chromadb.PersistentClient(path=chroma_path)
         
-        self.client = chromadb.PersistentClient(path=self.chroma_path)
-        
-        # Get or create collection
+        super().__init__(collection_name, embedding_generator, chroma_path, generation)
+
+    def _open_collection(self, name: str):
+        """Get or create a collection"""
         try:
-            self.collection = self.client.get_collection(name=collection_name)
-            print(f"Loaded existing ChromaDB collection: {collection_name}")
+            collection = self.client.get_collection(name=name)
+            print(f"Loaded existing ChromaDB collection: {name}")
         except Exception:
-            self.collection = self.client.create_collection(
-                name=collection_name,
+            collection = self.client.create_collection(
+                name=name,
                 metadata={"description": "Customer support documents"}
             )
-            print(f"Created new ChromaDB collection: {collection_name}")
+            print(f"Created new ChromaDB collection: {name}")
+        return collection
 
-    async def add_document(self, doc_id: str, embedding: List[float], metadata: Dict[str, Any]) -> None:
-        """Add a document to the vector store"""
+    def _collection_names(self) -> List[str]:
+        return [getattr(collection, 'name', collection) for collection in self.client.list_collections()]
+
+    def _delete_collection(self, name: str) -> None:
+        self.client.delete_collection(name=name)
+
+    def _collection_count(self, collection) -> int:
+        return collection.count()
+
+    def _collection_pages(self, collection, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["documents"])
+            if not page['ids']:
+                return
+            yield page['ids'], page['documents'] or [""] * len(page['ids'])
+            offset += len(page['ids'])
+
+    async def add_documents(self, ids: List[str], embeddings: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]], batch_size: Optional[int] = None, term_counts: Optional[List[Dict[str, int]]] = None) -> None:
+        """Upsert many documents with as few collection calls as Chroma's batch limit allows.
+        
+        IDs are used as given, so writing the same chunk again replaces it instead
+        of creating a duplicate vector. ``term_counts`` are the lexical index terms
+        of each text, counted here when the caller has not already done so.
+        """
         try:
-            # Ensure doc_id is unique
-            unique_id = f"{doc_id}_{uuid.uuid4().hex[:8]}"
+            batch_size = self._get_write_batch_size(batch_size)
+            if term_counts is None:
+                term_counts = count_terms(texts)
             
-            self.collection.add(
-                embeddings=[embedding],
-                documents=[metadata.get("text", "")],
-                metadatas=[metadata],
-                ids=[unique_id]
-            )
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                
+                await run_io(
+                    self.collection.upsert,
+                    embeddings=np.asarray(embeddings[start:end], dtype=np.float32),
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=ids[start:end]
+                )
+                self.lexical_index.add(ids[start:end], term_counts[start:end])
+                self.content_version += 1
             
         except Exception as e:
-            print(f"Error adding document to ChromaDB: {e}")
+            print(f"Error adding documents to ChromaDB: {e}")
             raise
 
-    async def similarity_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar documents"""
+    def _get_write_batch_size(self, batch_size: Optional[int] = None) -> int:
+        """Resolve the write batch size, capped at the maximum Chroma accepts per call"""
+        batch_size = batch_size or int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "64"))
         try:
-            # Generate query embedding
-            from utils.embeddings import EmbeddingGenerator
-            embedding_gen = EmbeddingGenerator()
-            query_embedding = await embedding_gen.generate_embedding(query)
-            
-            # Search in ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=top_k
-            )
+            batch_size = min(batch_size, self.client.get_max_batch_size())
+        except Exception:
+            pass
+        return max(1, batch_size)
+
+    async def _get_with_distance(self, ids: List[str], embedding: Sequence[float], where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch documents by ID with their distance to a query vector, in the collection's distance space"""
+        query_args = {'ids': ids, 'include': ["documents", "metadatas", "embeddings"]}
+        if where:
+            query_args['where'] = where
+        # A pinned generation may use a different distance space than the active one
+        collection = self._read_collection()
+        results = await run_io(collection.get, **query_args)
+        if not results['ids']:
+            return []
+        
+        vectors = np.asarray(results['embeddings'], dtype=np.float32)
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * max(float(np.linalg.norm(query_vector)), 1e-12)
+            distances = 1 - vectors @ query_vector / np.maximum(norms, 1e-12)
+        elif space == "ip":
+            distances = 1 - vectors @ query_vector
+        else:
+            distances = np.sum((vectors - query_vector) ** 2, axis=1)
+        
+        return [
+            {
+                'text': results['documents'][i],
+                'metadata': results['metadatas'][i] if results['metadatas'] else {},
+                'distance': float(distances[i]),
+                'id': results['ids'][i]
+            }
+            for i in range(len(results['ids']))
+        ]
+
+    async def search_many(self, vectors: Sequence[Sequence[float]], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Search several query vectors with one batched collection.query"""
+        if len(vectors) == 0:
+            return []
+        
+        try:
+            query_args = {
+                'query_embeddings': np.asarray(vectors, dtype=np.float32),
+                'n_results': top_k
+            }
+            if where:
+                query_args['where'] = where
             
-            # Format results
-            formatted_results = []
-            if results['documents'] and results['documents'][0]:
-                for i in range(len(results['documents'][0])):
-                    result = {
-                        'text': results['documents'][0][i],
-                        'metadata': results['metadatas'][0][i] if results['metadatas'] and results['metadatas'][0] else {},
-                        'distance': results['distances'][0][i] if results['distances'] and results['distances'][0] else 0.0,
-                        'id': results['ids'][0][i] if results['ids'] and results['ids'][0] else ""
-                    }
-                    formatted_results.append(result)
+            results = await run_io(self._read_collection().query, **query_args)
             
-            return formatted_results
+            return [self._format_query_results(results, i) for i in range(len(vectors))]
             
         except Exception as e:
             print(f"Error searching ChromaDB: {e}")
-            return []
+            return [[] for _ in vectors]
+
+    def _format_query_results(self, results: Dict[str, Any], query_index: int) -> List[Dict[str, Any]]:
+        """Format the results of one query from a collection.query response"""
+        documents = results['documents'][query_index] if results['documents'] else []
+        metadatas = results['metadatas'][query_index] if results['metadatas'] else None
+        distances = results['distances'][query_index] if results['distances'] else None
+        ids = results['ids'][query_index] if results['ids'] else None
+        
+        formatted_results = []
+        for i in range(len(documents or [])):
+            result = {
+                'text': documents[i],
+                'metadata': metadatas[i] if metadatas else {},
+                'distance': distances[i] if distances else 0.0,
+                'id': ids[i] if ids else ""
+            }
+            formatted_results.append(result)
+        
+        return formatted_results
 
     async def get_document_count(self) -> int:
         """Get total number of documents in the collection"""
         try:
-            return self.collection.count()
+            return await run_io(self._read_collection().count)
         except Exception as e:
             print(f"Error getting document count: {e}")
             return 0
@@ -87,12 +179,15 @@ class ChromaStore:
         """Clear all documents from the collection"""
         try:
             # Delete the collection and recreate it
-            self.client.delete_collection(name=self.collection_name)
+            name = self.collection.name
+            self.client.delete_collection(name=name)
             self.collection = self.client.create_collection(
-                name=self.collection_name,
+                name=name,
                 metadata={"description": "Customer support documents"}
             )
-            print(f"Cleared ChromaDB collection: {self.collection_name}")
+            self.lexical_index.clear()
+            self.content_version += 1
+            print(f"Cleared ChromaDB collection: {name}")
             
         except Exception as e:
             print(f"Error clearing collection: {e}")
@@ -101,16 +196,37 @@ class ChromaStore:
     async def delete_document(self, doc_id: str) -> bool:
         """Delete a specific document"""
         try:
-            self.collection.delete(ids=[doc_id])
+            await run_io(self.collection.delete, ids=[doc_id])
+            self.lexical_index.remove([doc_id])
+            self.content_version += 1
             return True
         except Exception as e:
             print(f"Error deleting document: {e}")
             return False
 
+    async def delete_by_source(self, filename: str) -> int:
+        """Delete every chunk of a source file, returning how many were removed"""
+        try:
+            results = await run_io(self.collection.get, where={"filename": filename}, include=[])
+            ids = results['ids'] if results and results['ids'] else []
+            
+            if ids:
+                batch_size = self._get_write_batch_size()
+                for start in range(0, len(ids), batch_size):
+                    await run_io(self.collection.delete, ids=ids[start:start + batch_size])
+                self.lexical_index.remove(ids)
+                self.content_version += 1
+            
+            return len(ids)
+            
+        except Exception as e:
+            print(f"Error deleting documents of {filename}: {e}")
+            raise
+
     async def get_all_documents(self) -> List[Dict[str, Any]]:
         """Get all documents from the collection"""
         try:
-            results = self.collection.get()
+            results = await run_io(self._read_collection().get)
             
             formatted_results = []
             if results['documents']:
@@ -134,14 +250,20 @@ class ChromaStore:
             count = self.collection.count()
             return {
                 'name': self.collection_name,
+                'collection': self.collection.name,
+                'generation': self.generation,
                 'document_count': count,
-                'path': self.chroma_path
+                'path': self.data_path,
+                'backend': self.backend
             }
         except Exception as e:
             print(f"Error getting collection info: {e}")
             return {
                 'name': self.collection_name,
+                'collection': self.collection.name,
+                'generation': self.generation,
                 'document_count': 0,
-                'path': self.chroma_path,
+                'path': self.data_path,
+                'backend': self.backend,
                 'error': str(e)
             }
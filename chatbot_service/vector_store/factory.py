@@ -0,0 +1,26 @@
+import os
+from typing import Optional
+
+from vector_store.base import VectorStore
+from vector_store.chroma_store import ChromaStore
+from vector_store.local_store import LocalVectorStore
+
+_shared_store: Optional[VectorStore] = None
+
+
+def create_vector_store(backend: Optional[str] = None, **kwargs) -> VectorStore:
+    """Create a vector store for a backend: "chroma" or "local" (default from VECTOR_BACKEND)"""
+    backend = (backend or os.getenv("VECTOR_BACKEND", "chroma")).lower()
+    if backend == "chroma":
+        return ChromaStore(**kwargs)
+    if backend == "local":
+        return LocalVectorStore(**kwargs)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def get_vector_store() -> VectorStore:
+    """Get the process-wide vector store, so chat and reindexing share one alias view"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = create_vector_store()
+    return _shared_store
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.embeddings import EmbeddingGenerator, get_embedding_generator
+from utils.executors import run_io
+from utils.tokenizer import tokenize
+
+
+class FAQIndex:
+    """Curated question -> answer pairs, matched before the RAG pipeline.
+
+    A query first looks for an exact match of its normalized tokens, then for
+    the most similar question embedding in the same language. Matches at or
+    above ``threshold`` cosine similarity are answered straight from the index.
+    """
+
+    def __init__(self, embedding_generator: Optional[EmbeddingGenerator] = None, threshold: float = 0.92, faq_file: str = "input/faq.json"):
+        self.embedding_generator = embedding_generator or get_embedding_generator()
+        self.threshold = threshold
+        self.faq_file = faq_file
+
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._exact: Dict[Tuple[str, str], str] = {}
+        # Per-language entry IDs and unit question vectors
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        # Serializes updates so concurrent admin calls do not drop each other's entries
+        self._update_lock = asyncio.Lock()
+
+        # Lookup statistics
+        self.lookups = 0
+        self.exact_hits = 0
+        self.vector_hits = 0
+
+    @staticmethod
+    def _normalize(question: str) -> str:
+        return " ".join(tokenize(question))
+
+    @staticmethod
+    def _entry_id(question: str, language: str) -> str:
+        return hashlib.md5(f"{language}\0{FAQIndex._normalize(question)}".encode()).hexdigest()[:16]
+
+    def _validate(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        question = str(entry.get("question", "")).strip()
+        answer = str(entry.get("answer", "")).strip()
+        if not question or not answer:
+            raise ValueError("FAQ entries need a question and an answer")
+        language = entry.get("language") or "en"
+        return {
+            "id": self._entry_id(question, language),
+            "question": question,
+            "answer": answer,
+            "language": language,
+            "category": entry.get("category") or "Product FAQ",
+            "alternatives": [str(text).strip() for text in entry.get("alternatives", []) if str(text).strip()]
+        }
+
+    async def load_file(self, path: Optional[str] = None) -> int:
+        """Replace the index with the entries of a JSON file; a missing file leaves it empty"""
+        path = path or self.faq_file
+        if not os.path.exists(path):
+            return 0
+
+        def read() -> List[Dict[str, Any]]:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        try:
+            entries = await run_io(read)
+            await self.set_entries(entries)
+            print(f"Loaded {len(self.entries)} FAQ entries from {path}")
+        except Exception as e:
+            print(f"Error loading FAQ file {path}: {e}")
+        return len(self.entries)
+
+    async def save_file(self, path: Optional[str] = None) -> None:
+        """Write the entries back to the FAQ file with an atomic replace"""
+        path = path or self.faq_file
+        entries = [
+            {key: value for key, value in entry.items() if key != "id" and (key != "alternatives" or value)}
+            for entry in self.entries.values()
+        ]
+
+        def write() -> None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+
+        await run_io(write)
+
+    async def set_entries(self, entries: Sequence[Dict[str, Any]]) -> None:
+        """Replace every entry"""
+        validated = {entry["id"]: entry for entry in map(self._validate, entries)}
+        async with self._update_lock:
+            await self._rebuild(validated)
+
+    async def add_entries(self, entries: Sequence[Dict[str, Any]]) -> List[str]:
+        """Add or update entries, keyed on language and normalized question; returns their IDs"""
+        validated = [self._validate(entry) for entry in entries]
+        async with self._update_lock:
+            merged = dict(self.entries)
+            merged.update((entry["id"], entry) for entry in validated)
+            await self._rebuild(merged)
+        return [entry["id"] for entry in validated]
+
+    async def remove_entry(self, entry_id: str) -> bool:
+        """Remove one entry"""
+        async with self._update_lock:
+            if entry_id not in self.entries:
+                return False
+            remaining = {key: entry for key, entry in self.entries.items() if key != entry_id}
+            await self._rebuild(remaining)
+        return True
+
+    async def _rebuild(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Embed every question variant and swap in the new lookup tables at once"""
+        exact: Dict[Tuple[str, str], str] = {}
+        rows: List[Tuple[str, str, str]] = []
+        for entry_id, entry in entries.items():
+            for question in [entry["question"], *entry["alternatives"]]:
+                exact[(entry["language"], self._normalize(question))] = entry_id
+                rows.append((entry["language"], entry_id, question))
+
+        matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        if rows:
+            vectors = await run_io(self.embedding_generator.generate_embeddings_matrix, [row[2] for row in rows])
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+            for language in {row[0] for row in rows}:
+                positions = [i for i, row in enumerate(rows) if row[0] == language]
+                matrices[language] = ([rows[i][1] for i in positions], vectors[positions])
+
+        self.entries, self._exact, self._matrices = entries, exact, matrices
+
+    def match(self, query: str, language: str, query_embedding: Optional[Sequence[float]] = None, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the matching entry with its score and match type, or None; ``threshold`` overrides the default"""
+        if not self.entries:
+            return None
+        self.lookups += 1
+
+        entry_id = self._exact.get((language, self._normalize(query)))
+        if entry_id is not None:
+            self.exact_hits += 1
+            return {**self.entries[entry_id], "score": 1.0, "match": "exact"}
+
+        if query_embedding is None or language not in self._matrices:
+            return None
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+
+        ids, matrix = self._matrices[language]
+        scores = matrix @ (vector / norm)
+        best = int(np.argmax(scores))
+        if scores[best] < (self.threshold if threshold is None else threshold):
+            return None
+        self.vector_hits += 1
+        return {**self.entries[ids[best]], "score": float(scores[best]), "match": "vector"}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get entry counts and hit rates"""
+        hits = self.exact_hits + self.vector_hits
+        return {
+            "entries": len(self.entries),
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "exact_hits": self.exact_hits,
+            "vector_hits": self.vector_hits,
+            "hit_ratio": hits / self.lookups if self.lookups else 0.0
+        }
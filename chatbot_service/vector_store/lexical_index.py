@@ -0,0 +1,253 @@
+import math
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.tokenizer import tokenize
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over chunk text.
+
+    Each term keeps two compact arrays: the internal numbers of the chunks it
+    occurs in (uint32, ascending because numbers are handed out in insertion
+    order) and its frequency in each of them (uint16). Removed or replaced
+    chunks are tombstoned and dropped from the postings when the index is
+    compacted on save.
+
+    A query scores its rarest terms over their full postings until
+    ``max_postings`` have been visited; more common terms after that only
+    rescore chunks that are already candidates. A query whose rarest term
+    alone has more postings than that matches nothing, leaving the ranking to
+    the vector search. This bounds the work per lookup however large the
+    collection grows.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75, max_postings: int = 10000):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_postings = max_postings
+        self._reset()
+
+        # Lookup statistics
+        self.searches = 0
+        self.postings_scored = 0
+        self.postings_rescored = 0
+
+    def _reset(self) -> None:
+        self._terms: Dict[str, int] = {}
+        self._docs: List[array] = []
+        self._tfs: List[array] = []
+        self._ids: List[str] = []
+        self._numbers: Dict[str, int] = {}
+        self._lengths = array('I')
+        self._alive = bytearray()
+        self._total_length = 0
+        self._scores = np.zeros(0, dtype=np.float32)
+        # BM25 length normalization per chunk, recomputed when chunks are added or removed
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._norms_key = (0, 0)
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def add(self, ids: Sequence[str], term_counts: Sequence[Dict[str, int]]) -> None:
+        """Index chunks by ID; an ID that is already indexed is replaced"""
+        self.remove([chunk_id for chunk_id in ids if chunk_id in self._numbers])
+        for chunk_id, counts in zip(ids, term_counts):
+            number = len(self._ids)
+            self._ids.append(chunk_id)
+            self._numbers[chunk_id] = number
+            length = sum(counts.values())
+            self._lengths.append(length)
+            self._alive.append(1)
+            self._total_length += length
+
+            for term, tf in counts.items():
+                term_id = self._terms.get(term)
+                if term_id is None:
+                    term_id = self._terms[term] = len(self._docs)
+                    self._docs.append(array('I'))
+                    self._tfs.append(array('H'))
+                self._docs[term_id].append(number)
+                self._tfs[term_id].append(min(tf, 65535))
+        self.dirty = self.dirty or bool(ids)
+
+    def remove(self, ids: Sequence[str]) -> None:
+        """Tombstone chunks by ID; unknown IDs are ignored"""
+        for chunk_id in ids:
+            number = self._numbers.pop(chunk_id, None)
+            if number is not None:
+                self._alive[number] = 0
+                self._total_length -= self._lengths[number]
+                self.dirty = True
+
+    def clear(self) -> None:
+        self._reset()
+        self.dirty = True
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """IDs and BM25 scores of the best matching chunks, best first"""
+        self.searches += 1
+        chunks = len(self._numbers)
+        if not chunks or top_k <= 0:
+            return []
+
+        terms = [self._terms[term] for term in set(tokenize(query)) if term in self._terms]
+        if not terms:
+            return []
+        terms.sort(key=lambda term_id: len(self._docs[term_id]))
+        if len(self._docs[terms[0]]) > self.max_postings:
+            return []
+
+        if len(self._scores) < len(self._ids):
+            self._scores = np.zeros(len(self._ids) + 1024, dtype=np.float32)
+        scores = self._scores
+        norms = self._length_norms()
+
+        touched: List[np.ndarray] = []
+        visited = 0
+        try:
+            for term_id in terms:
+                docs = np.frombuffer(self._docs[term_id], dtype=np.uint32)
+                tfs = np.frombuffer(self._tfs[term_id], dtype=np.uint16)
+                df = len(docs)
+                idf = math.log(1 + (chunks - df + 0.5) / (df + 0.5))
+
+                if touched and visited + df > self.max_postings:
+                    # Common term: only rescore chunks that rarer terms already found
+                    candidates = touched[0] if len(touched) == 1 else np.unique(np.concatenate(touched))
+                    positions = np.searchsorted(docs, candidates)
+                    positions[positions == df] = 0
+                    found = docs[positions] == candidates
+                    docs, tfs = candidates[found], tfs[positions[found]]
+                    self.postings_rescored += len(docs)
+                else:
+                    visited += df
+                    self.postings_scored += df
+                    touched.append(docs)
+
+                tf = tfs.astype(np.float32)
+                scores[docs] += idf * (self.k1 + 1) * tf / (tf + norms[docs])
+
+            candidates = np.concatenate(touched) if len(touched) > 1 else touched[0]
+            candidate_scores = scores[candidates] * np.frombuffer(self._alive, dtype=np.uint8)[candidates]
+
+            # A chunk matching several terms appears once per term; take enough to fill top_k after deduplication
+            wanted = min(len(candidates), top_k * len(touched))
+            best = np.argpartition(-candidate_scores, wanted - 1)[:wanted] if wanted < len(candidates) else np.arange(len(candidates))
+            best = best[np.argsort(-candidate_scores[best], kind='stable')]
+
+            results: List[Tuple[str, float]] = []
+            seen = set()
+            for index in best:
+                number = int(candidates[index])
+                score = float(candidate_scores[index])
+                if score <= 0 or number in seen:
+                    continue
+                seen.add(number)
+                results.append((self._ids[number], score))
+                if len(results) == top_k:
+                    break
+            return results
+        finally:
+            for docs in touched:
+                scores[docs] = 0.0
+
+    def _length_norms(self) -> np.ndarray:
+        key = (len(self._ids), self._total_length)
+        if self._norms_key != key:
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            avg_length = max(1.0, self._total_length / max(1, len(self._numbers)))
+            self._norms = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            self._norms_key = key
+        return self._norms
+
+    def compact(self) -> None:
+        """Drop tombstoned chunks from the postings and renumber the live ones"""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        if alive.all():
+            return
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+
+        terms: Dict[str, int] = {}
+        docs_lists: List[array] = []
+        tfs_lists: List[array] = []
+        for term, term_id in self._terms.items():
+            docs = np.frombuffer(self._docs[term_id], dtype=np.uint32)
+            keep = alive[docs]
+            if not keep.any():
+                continue
+            terms[term] = len(docs_lists)
+            docs_lists.append(array('I', renumber[docs[keep]].astype(np.uint32).tobytes()))
+            tfs_lists.append(array('H', np.frombuffer(self._tfs[term_id], dtype=np.uint16)[keep].tobytes()))
+
+        self._ids = [chunk_id for chunk_id, live in zip(self._ids, alive) if live]
+        self._numbers = {chunk_id: number for number, chunk_id in enumerate(self._ids)}
+        self._lengths = array('I', np.frombuffer(self._lengths, dtype=np.uint32)[alive].tobytes())
+        self._alive = bytearray(b'\x01' * len(self._ids))
+        self._terms, self._docs, self._tfs = terms, docs_lists, tfs_lists
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._norms_key = (0, 0)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Compact the index and copy it into flat arrays for ``write``"""
+        self.compact()
+        terms = list(self._terms)
+        docs = [np.frombuffer(self._docs[self._terms[term]], dtype=np.uint32) for term in terms]
+        tfs = [np.frombuffer(self._tfs[self._terms[term]], dtype=np.uint16) for term in terms]
+        self.dirty = False
+        return {
+            'terms': np.array("\n".join(terms)),
+            'ids': np.array("\n".join(self._ids)),
+            'lengths': np.array(self._lengths, dtype=np.uint32),
+            'offsets': np.concatenate(([0], np.cumsum([len(term_docs) for term_docs in docs], dtype=np.int64))),
+            'docs': np.concatenate(docs) if docs else np.zeros(0, dtype=np.uint32),
+            'tfs': np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.uint16)
+        }
+
+    def write(self, snapshot: Dict[str, np.ndarray]) -> None:
+        """Write a snapshot to ``path`` with an atomic file replace; safe to run off the event loop"""
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_file = f"{self.path}.tmp.npz"
+        np.savez(tmp_file, **snapshot)
+        os.replace(tmp_file, self.path)
+
+    def load(self) -> bool:
+        """Read the index from ``path``; returns False when there is no saved index"""
+        if self.path is None or not os.path.exists(self.path):
+            return False
+        with np.load(self.path) as data:
+            terms = str(data['terms']).split("\n") if str(data['terms']) else []
+            ids = str(data['ids']).split("\n") if str(data['ids']) else []
+            offsets, docs, tfs = data['offsets'], data['docs'], data['tfs']
+
+            self._reset()
+            self._ids = ids
+            self._numbers = {chunk_id: number for number, chunk_id in enumerate(ids)}
+            self._lengths = array('I', data['lengths'].astype(np.uint32).tobytes())
+            self._alive = bytearray(b'\x01' * len(ids))
+            self._total_length = int(data['lengths'].sum())
+            for term_id, term in enumerate(terms):
+                self._terms[term] = term_id
+                self._docs.append(array('I', docs[offsets[term_id]:offsets[term_id + 1]].tobytes()))
+                self._tfs.append(array('H', tfs[offsets[term_id]:offsets[term_id + 1]].tobytes()))
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index size and how much postings work lookups did"""
+        return {
+            'chunks': len(self._numbers),
+            'terms': len(self._terms),
+            'postings': sum(len(docs) for docs in self._docs),
+            'tombstones': len(self._ids) - len(self._numbers),
+            'searches': self.searches,
+            'avg_postings_scored': self.postings_scored / self.searches if self.searches else 0.0,
+            'avg_postings_rescored': self.postings_rescored / self.searches if self.searches else 0.0
+        }
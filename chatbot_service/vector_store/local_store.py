@@ -0,0 +1,731 @@
+import heapq
+import json
+import math
+import os
+import random
+import shutil
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.embeddings import EmbeddingGenerator
+from utils.executors import run_io
+from utils.tokenizer import count_terms
+from vector_store.base import BaseVectorStore
+
+
+class _MappedMatrix:
+    """A [capacity, width] array in a file, memory-mapped and grown by doubling.
+
+    Growing maps the file again; readers still holding the previous mapping
+    keep seeing valid data for the rows it covered. ``array`` is a plain
+    ndarray view of the mapping, which indexes much faster than np.memmap.
+    """
+
+    def __init__(self, path: str, dtype, width: int, fill: int = 0):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.fill = fill
+        self.capacity = 0
+        self.array: Optional[np.ndarray] = None
+        self._mapping: Optional[np.memmap] = None
+
+        if os.path.exists(path):
+            capacity = os.path.getsize(path) // (self.dtype.itemsize * width)
+            if capacity:
+                self._map(capacity)
+
+    def _map(self, capacity: int) -> None:
+        self._mapping = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity, self.width))
+        self.array = self._mapping.view(np.ndarray)
+        self.capacity = capacity
+
+    def ensure(self, rows: int) -> None:
+        if rows <= self.capacity:
+            return
+        previous = self.capacity
+        self.flush()
+        with open(self.path, 'ab') as f:
+            f.truncate(max(rows, previous * 2, 1024) * self.width * self.dtype.itemsize)
+        self._map(max(rows, previous * 2, 1024))
+        if self.fill:
+            self.array[previous:] = self.fill
+
+    def flush(self) -> None:
+        if self._mapping is not None:
+            self._mapping.flush()
+
+
+def _grow(array: np.ndarray, rows: int, fill=0) -> np.ndarray:
+    """Copy of a 1-D array with room for at least ``rows`` entries, or the array itself if it has room"""
+    if rows <= len(array):
+        return array
+    grown = np.full(max(rows, len(array) * 2, 1024), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class HNSWGraph:
+    """Hierarchical navigable small world graph over the rows of a vector matrix.
+
+    Nodes are row numbers. Layer 0 links live in a memory-mapped file with
+    ``2 * m`` slots per row; the sparse upper layers are kept in dicts and saved
+    with ``save``. Distances are squared L2 like Chroma's default space.
+    """
+
+    def __init__(self, path: str, m: int = 16, ef_construction: int = 64, ef_search: int = 64, seed: int = 0):
+        self.path = path
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / math.log(m)
+        self._rng = random.Random(seed)
+
+        self.links0 = _MappedMatrix(os.path.join(path, "hnsw_links.i32"), np.int32, self.m0, fill=-1)
+        self.upper: List[Dict[int, np.ndarray]] = []
+        self.entry = -1
+        self.max_level = 0
+        # Rows below this have been offered to the graph (tombstoned rows are skipped)
+        self.count = 0
+
+    @staticmethod
+    def _distances(query: np.ndarray, query_norm: float, nodes: Sequence[int], vectors: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        return norms[nodes] - 2 * (vectors[nodes] @ query) + query_norm
+
+    def _neighbors(self, node: int, level: int) -> np.ndarray:
+        if level == 0:
+            links = self.links0.array[node]
+            return links[links >= 0]
+        return self.upper[level - 1].get(node, np.empty(0, dtype=np.int32))
+
+    def _search_layer(self, query, query_norm, entry_points: List[int], ef: int, level: int, vectors, norms, allowed: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """Closest ``ef`` nodes of one layer as sorted (distance, node); ``allowed`` limits which nodes are returned, not which are visited"""
+        # Nodes a concurrent insert linked in after this search captured the arrays are skipped
+        limit = min(len(vectors), len(norms), len(allowed) if allowed is not None else len(norms))
+        visited = set(entry_points)
+        distances = self._distances(query, query_norm, entry_points, vectors, norms).tolist()
+        candidates = list(zip(distances, entry_points))
+        heapq.heapify(candidates)
+        results = [(-d, node) for d, node in candidates if allowed is None or allowed[node]]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if len(results) >= ef and distance > -results[0][0]:
+                break
+            fresh = [neighbor for neighbor in self._neighbors(node, level).tolist() if neighbor < limit and neighbor not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for neighbor_distance, neighbor in zip(self._distances(query, query_norm, fresh, vectors, norms).tolist(), fresh):
+                if len(results) < ef or neighbor_distance < -results[0][0]:
+                    heapq.heappush(candidates, (neighbor_distance, neighbor))
+                    if allowed is None or allowed[neighbor]:
+                        heapq.heappush(results, (-neighbor_distance, neighbor))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+
+        return sorted((-d, node) for d, node in results)
+
+    def _select(self, found: List[Tuple[float, int]], m: int, vectors) -> List[int]:
+        """Neighbor selection heuristic: skip candidates closer to an already selected neighbor than to the new node"""
+        if len(found) <= m:
+            return [node for _, node in found]
+        nodes = [node for _, node in found]
+        points = vectors[nodes]
+        squares = np.einsum('ij,ij->i', points, points)
+        pairs = (squares[:, None] + squares[None, :] - 2 * (points @ points.T)).tolist()
+        selected: List[int] = []
+        skipped: List[int] = []
+        for i, (distance, _) in enumerate(found):
+            if len(selected) == m:
+                break
+            if any(pairs[i][j] < distance for j in selected):
+                skipped.append(i)
+                continue
+            selected.append(i)
+        selected.extend(skipped[:m - len(selected)])
+        return [nodes[i] for i in selected]
+
+    def _set_links(self, node: int, level: int, links: List[int]) -> None:
+        if level == 0:
+            row = np.full(self.m0, -1, dtype=np.int32)
+            row[:len(links)] = links
+            self.links0.array[node] = row
+        else:
+            self.upper[level - 1][node] = np.asarray(links, dtype=np.int32)
+
+    def _link(self, node: int, new: int, level: int, vectors, norms) -> None:
+        """Add a link from ``node`` to ``new``, dropping the farthest link when the node is full"""
+        limit = self.m0 if level == 0 else self.m
+        links = self._neighbors(node, level).tolist()
+        if len(links) < limit:
+            self._set_links(node, level, links + [new])
+            return
+        links.append(new)
+        distances = self._distances(vectors[node], float(norms[node]), links, vectors, norms)
+        self._set_links(node, level, [links[i] for i in np.argsort(distances)[:limit]])
+
+    def insert(self, row: int, vectors, norms) -> None:
+        level = int(-math.log(1 - self._rng.random()) * self.level_mult)
+        self.links0.ensure(row + 1)
+        while len(self.upper) < level:
+            self.upper.append({})
+        for lc in range(1, level + 1):
+            self.upper[lc - 1].setdefault(row, np.empty(0, dtype=np.int32))
+        self.count = max(self.count, row + 1)
+
+        if self.entry < 0:
+            self.entry, self.max_level = row, level
+            return
+
+        query = vectors[row]
+        query_norm = float(norms[row])
+        entry_points = [self.entry]
+        for lc in range(self.max_level, level, -1):
+            entry_points = [self._search_layer(query, query_norm, entry_points, 1, lc, vectors, norms)[0][1]]
+
+        for lc in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(query, query_norm, entry_points, self.ef_construction, lc, vectors, norms)
+            neighbors = self._select(found, self.m, vectors)
+            self._set_links(row, lc, neighbors)
+            for neighbor in neighbors:
+                self._link(neighbor, row, lc, vectors, norms)
+            entry_points = [node for _, node in found]
+
+        if level > self.max_level:
+            self.entry, self.max_level = row, level
+
+    def search(self, query: np.ndarray, k: int, vectors, norms, allowed: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """Approximate ``k`` nearest allowed rows as sorted (distance, row)"""
+        if self.entry < 0:
+            return []
+        query_norm = float(query @ query)
+        entry_points = [self.entry]
+        for lc in range(self.max_level, 0, -1):
+            entry_points = [self._search_layer(query, query_norm, entry_points, 1, lc, vectors, norms)[0][1]]
+        return self._search_layer(query, query_norm, entry_points, max(self.ef_search, k), 0, vectors, norms, allowed)[:k]
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """Upper layers and entry point as flat arrays; layer 0 is already on disk"""
+        arrays = {'header': np.array([self.entry, self.max_level, self.count, len(self.upper)], dtype=np.int64)}
+        for level, layer in enumerate(self.upper, start=1):
+            nodes = list(layer)
+            links = [layer[node] for node in nodes]
+            arrays[f'nodes_{level}'] = np.asarray(nodes, dtype=np.int32)
+            arrays[f'offsets_{level}'] = np.concatenate(([0], np.cumsum([len(node_links) for node_links in links], dtype=np.int64)))
+            arrays[f'links_{level}'] = np.concatenate(links).astype(np.int32) if links else np.zeros(0, dtype=np.int32)
+        return arrays
+
+    def write(self, snapshot: Dict[str, np.ndarray]) -> None:
+        self.links0.flush()
+        tmp_file = os.path.join(self.path, "hnsw.tmp.npz")
+        np.savez(tmp_file, **snapshot)
+        os.replace(tmp_file, os.path.join(self.path, "hnsw.npz"))
+
+    def load(self, rows: int) -> None:
+        """Read the saved upper layers; links to rows beyond what was saved are dropped and re-inserted later"""
+        meta_file = os.path.join(self.path, "hnsw.npz")
+        if not os.path.exists(meta_file) or self.links0.array is None:
+            self.links0.ensure(max(rows, 1))
+            self.links0.array[:] = -1
+            return
+        with np.load(meta_file) as data:
+            self.entry, self.max_level, count, levels = (int(value) for value in data['header'])
+            self.count = min(count, rows)
+            self.upper = []
+            for level in range(1, levels + 1):
+                nodes, offsets, links = data[f'nodes_{level}'], data[f'offsets_{level}'], data[f'links_{level}']
+                layer = {}
+                for i, node in enumerate(nodes.tolist()):
+                    if node < self.count:
+                        node_links = links[offsets[i]:offsets[i + 1]]
+                        layer[node] = node_links[node_links < self.count]
+                self.upper.append(layer)
+        if self.entry >= self.count:
+            self.entry, self.max_level, self.upper = -1, 0, []
+            self.count = 0
+        self.links0.ensure(max(rows, 1))
+        links0 = self.links0.array
+        links0[self.count:] = -1
+        links0[:self.count][links0[:self.count] >= self.count] = -1
+
+
+@dataclass(frozen=True)
+class _RowView:
+    """Rows readers may look at, with their live flags and squared norms.
+
+    Writers build a new view and publish it in one assignment, so a search
+    never sees half of a write.
+    """
+
+    rows: int
+    alive: np.ndarray
+    norms: np.ndarray
+
+
+class LocalCollection:
+    """One generation of the local store, kept in its own directory.
+
+    Vectors are rows of a memory-mapped float32 file. IDs, texts and metadata
+    are held in memory; every write is appended to a journal, and ``write``
+    folds the journal into a snapshot. Deleted or replaced documents leave a
+    tombstoned row behind.
+
+    Searches multiply the query by the whole matrix, or walk an HNSW graph:
+    always with index mode "hnsw", never with "exact", and with "auto" once
+    the collection holds ``hnsw_min_rows`` documents. Filtered searches that
+    match fewer rows than that are exact over the matching rows.
+    """
+
+    def __init__(self, path: str, name: str, index_mode: str = "auto", hnsw_min_rows: int = 20000, **hnsw_params):
+        self.path = path
+        self.name = name
+        self.index_mode = index_mode
+        self.hnsw_min_rows = hnsw_min_rows
+        self.hnsw_params = hnsw_params
+        os.makedirs(path, exist_ok=True)
+        self._records_file = os.path.join(path, "records.json")
+        self._journal_file = os.path.join(path, "records.journal")
+        self._lock = threading.Lock()
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.dim = 0
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.id_rows: Dict[str, int] = {}
+        self.view = _RowView(0, np.zeros(0, dtype=bool), np.zeros(0, dtype=np.float32))
+        self.vectors: Optional[_MappedMatrix] = None
+        self.graph: Optional[HNSWGraph] = None
+        # Sequence number of the last journal entry; the snapshot records the one it includes
+        self._seq = 0
+        # Metadata fields used in filters: per row value codes, and the code of each value
+        self._field_codes: Dict[str, Tuple[np.ndarray, Dict[Any, int]]] = {}
+
+    def count(self) -> int:
+        return len(self.id_rows)
+
+    def _load(self) -> None:
+        view = self.view
+        if os.path.exists(self._records_file):
+            with open(self._records_file, 'r') as f:
+                records = json.load(f)
+            self.dim = records['dim']
+            self._seq = records.get('seq', 0)
+            view = self._append_rows(view, records['ids'], records['documents'], records['metadatas'])
+            for row in records['deleted']:
+                self._tombstone(view.alive, row)
+        if os.path.exists(self._journal_file):
+            with open(self._journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # Torn last line of an interrupted write
+                    # Entries already folded into the snapshot, left behind by an interrupted write()
+                    if entry['seq'] <= self._seq:
+                        continue
+                    self._seq = entry['seq']
+                    if entry['op'] == 'upsert':
+                        self.dim = entry['dim']
+                        view = self._append_rows(view, entry['ids'], entry['documents'], entry['metadatas'])
+                    elif entry['op'] == 'delete':
+                        for chunk_id in entry['ids']:
+                            if chunk_id in self.id_rows:
+                                self._tombstone(view.alive, self.id_rows[chunk_id])
+
+        if self.dim:
+            self.vectors = _MappedMatrix(os.path.join(self.path, "vectors.f32"), np.float32, self.dim)
+            if self.vectors.capacity < view.rows:
+                raise ValueError(f"Vector file of {self.name} has {self.vectors.capacity} rows, records need {view.rows}")
+            for start in range(0, view.rows, 65536):
+                block = self.vectors.array[start:min(view.rows, start + 65536)]
+                view.norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+
+        if self._wants_graph():
+            graph = HNSWGraph(self.path, **self.hnsw_params)
+            graph.load(view.rows)
+            self._index_rows(graph, view, graph.count)
+            self.graph = graph
+        self.view = view
+
+    def _append_rows(self, view: _RowView, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]) -> _RowView:
+        """View with rows appended; replaced IDs are tombstoned in a copy, so ``view`` itself is unchanged"""
+        start, end = view.rows, view.rows + len(ids)
+        alive = _grow(view.alive.copy(), end, False)
+        # Norms of new rows go past the rows readers look at, so the array can be shared
+        norms = _grow(view.norms, end)
+        for field, (codes, values) in list(self._field_codes.items()):
+            codes = _grow(codes, end, -1)
+            for i, metadata in enumerate(metadatas):
+                codes[start + i] = values.setdefault(metadata.get(field), len(values))
+            self._field_codes[field] = (codes, values)
+        for i, chunk_id in enumerate(ids):
+            previous = self.id_rows.get(chunk_id)
+            if previous is not None:
+                alive[previous] = False
+            self.id_rows[chunk_id] = start + i
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+        alive[start:end] = True
+        return _RowView(end, alive, norms)
+
+    def _tombstone(self, alive: np.ndarray, row: int) -> None:
+        alive[row] = False
+        if self.id_rows.get(self.ids[row]) == row:
+            del self.id_rows[self.ids[row]]
+
+    def _journal(self, entry: Dict[str, Any]) -> None:
+        self._seq += 1
+        with open(self._journal_file, 'a') as f:
+            f.write(json.dumps({'seq': self._seq, **entry}) + "\n")
+
+    def _wants_graph(self) -> bool:
+        return self.index_mode == "hnsw" or (self.index_mode == "auto" and self.count() >= self.hnsw_min_rows)
+
+    def _index_rows(self, graph: HNSWGraph, view: _RowView, start: int) -> None:
+        """Insert the live rows of ``view`` from ``start`` on into a graph"""
+        for row in range(start, view.rows):
+            if view.alive[row]:
+                graph.insert(row, self.vectors.array, view.norms)
+        graph.count = max(graph.count, view.rows)
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Append documents; an ID that already exists is replaced.
+
+        Readers see the new rows only once the whole batch is indexed.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.vectors is None:
+                self.dim = vectors.shape[1]
+                self.vectors = _MappedMatrix(os.path.join(self.path, "vectors.f32"), np.float32, self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Collection {self.name} holds {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            # Vectors first, so a journal entry never points at rows missing from the vector file
+            start = self.view.rows
+            self.vectors.ensure(start + len(ids))
+            self.vectors.array[start:start + len(ids)] = vectors
+            self._journal({'op': 'upsert', 'dim': self.dim, 'ids': ids, 'documents': documents, 'metadatas': metadatas})
+            view = self._append_rows(self.view, ids, documents, metadatas)
+            view.norms[start:view.rows] = np.einsum('ij,ij->i', vectors, vectors)
+
+            if self.graph is None and self._wants_graph():
+                # Searches keep using exact search until the graph is complete
+                graph = HNSWGraph(self.path, **self.hnsw_params)
+                graph.load(0)
+                self._index_rows(graph, view, 0)
+                self.graph, self.view = graph, view
+            else:
+                if self.graph is not None:
+                    self._index_rows(self.graph, view, start)
+                self.view = view
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            rows = [self.id_rows[chunk_id] for chunk_id in ids if chunk_id in self.id_rows]
+            if rows:
+                self._journal({'op': 'delete', 'ids': [self.ids[row] for row in rows]})
+                alive = self.view.alive.copy()
+                for row in rows:
+                    self._tombstone(alive, row)
+                self.view = _RowView(self.view.rows, alive, self.view.norms)
+            return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+            self._reset()
+
+    def _field_mask(self, field: str, wanted: Sequence[Any], size: int) -> np.ndarray:
+        if field not in self._field_codes:
+            with self._lock:
+                values: Dict[Any, int] = {}
+                codes = np.full(len(self.metadatas), -1, dtype=np.int32)
+                for row, metadata in enumerate(self.metadatas):
+                    codes[row] = values.setdefault(metadata.get(field), len(values))
+                self._field_codes[field] = (codes, values)
+        codes, values = self._field_codes[field]
+        wanted_codes = [values[value] for value in wanted if value in values]
+        mask = np.zeros(size, dtype=bool)
+        limit = min(size, len(codes))
+        mask[:limit] = np.isin(codes[:limit], wanted_codes)
+        return mask
+
+    def _where_mask(self, where: Dict[str, Any], size: int) -> np.ndarray:
+        """Rows matching a Chroma-style filter: equality, $eq, $in, $and and $or"""
+        if "$and" in where:
+            return np.logical_and.reduce([self._where_mask(clause, size) for clause in where["$and"]])
+        if "$or" in where:
+            return np.logical_or.reduce([self._where_mask(clause, size) for clause in where["$or"]])
+        mask = np.ones(size, dtype=bool)
+        for field, condition in where.items():
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    wanted = [condition["$eq"]]
+                elif "$in" in condition:
+                    wanted = list(condition["$in"])
+                else:
+                    raise ValueError(f"Unsupported filter on {field}: {condition}")
+            else:
+                wanted = [condition]
+            mask &= self._field_mask(field, wanted, size)
+        return mask
+
+    def _allowed(self, view: _RowView, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Live rows of a view that match ``where``"""
+        allowed = view.alive[:view.rows].copy()
+        if where:
+            allowed &= self._where_mask(where, view.rows)
+        return allowed
+
+    def _result(self, row: int, distance: float) -> Dict[str, Any]:
+        return {'text': self.documents[row], 'metadata': self.metadatas[row], 'distance': distance, 'id': self.ids[row]}
+
+    def query(self, queries: np.ndarray, top_k: int, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Nearest documents of each query vector by squared L2 distance"""
+        graph, view = self.graph, self.view
+        if self.vectors is None or not view.rows:
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32)
+        allowed = self._allowed(view, where)
+        if graph is not None and (where is None or int(allowed.sum()) >= self.hnsw_min_rows):
+            # ``allowed`` ends at the view's rows, so nodes inserted after it was taken are skipped
+            vectors = self.vectors.array
+            return [
+                [self._result(row, distance) for distance, row in graph.search(query, top_k, vectors, view.norms, allowed)]
+                for query in queries
+            ]
+
+        # Exact search over the allowed rows only
+        candidates = np.flatnonzero(allowed)
+        if not len(candidates):
+            return [[] for _ in queries]
+        matrix = self.vectors.array[:view.rows] if len(candidates) == view.rows else self.vectors.array[candidates]
+        distances = view.norms[candidates][None, :] - 2 * (queries @ matrix.T) + np.einsum('ij,ij->i', queries, queries)[:, None]
+
+        results = []
+        k = min(top_k, len(candidates))
+        for query_distances in distances:
+            best = np.argpartition(query_distances, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+            best = best[np.argsort(query_distances[best])]
+            results.append([self._result(int(candidates[i]), float(query_distances[i])) for i in best])
+        return results
+
+    def get_with_distance(self, ids: List[str], query: Sequence[float], where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        view = self.view
+        allowed = self._allowed(view, where)
+        rows = [row for row in (self.id_rows.get(chunk_id) for chunk_id in ids) if row is not None and row < view.rows and allowed[row]]
+        if not rows:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        distances = view.norms[rows] - 2 * (self.vectors.array[rows] @ query) + float(query @ query)
+        return [self._result(row, float(distance)) for row, distance in zip(rows, distances)]
+
+    def ids_where(self, where: Dict[str, Any]) -> List[str]:
+        return [self.ids[row] for row in np.flatnonzero(self._allowed(self.view, where))]
+
+    def pages(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        view = self.view
+        rows = np.flatnonzero(view.alive[:view.rows])
+        for start in range(0, len(rows), page_size):
+            page = rows[start:start + page_size]
+            yield [self.ids[row] for row in page], [self.documents[row] for row in page]
+
+    def get_all(self) -> List[Dict[str, Any]]:
+        view = self.view
+        return [
+            {'text': self.documents[row], 'metadata': self.metadatas[row], 'id': self.ids[row]}
+            for row in np.flatnonzero(view.alive[:view.rows])
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of the records and graph state taken under the write lock, for ``write``"""
+        with self._lock:
+            return {
+                'records': {
+                    'seq': self._seq,
+                    'dim': self.dim,
+                    'ids': list(self.ids),
+                    'documents': list(self.documents),
+                    'metadatas': list(self.metadatas),
+                    'deleted': np.flatnonzero(~self.view.alive[:self.view.rows]).tolist()
+                },
+                'journal_size': os.path.getsize(self._journal_file) if os.path.exists(self._journal_file) else 0,
+                'graph': self.graph.snapshot() if self.graph is not None else None
+            }
+
+    def write(self, snapshot: Dict[str, Any]) -> None:
+        """Save a snapshot and drop the journal entries it covers.
+
+        The snapshot records the sequence number of its last journal entry, so
+        entries left behind by a crash before the journal is trimmed are
+        skipped on load rather than replayed twice.
+        """
+        if self.vectors is not None:
+            self.vectors.flush()
+        if snapshot['graph'] is not None:
+            self.graph.write(snapshot['graph'])
+
+        tmp_file = f"{self._records_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(snapshot['records'], f)
+        os.replace(tmp_file, self._records_file)
+
+        with self._lock:
+            # Keep journal entries written while the snapshot was being saved
+            if os.path.exists(self._journal_file):
+                with open(self._journal_file, 'r') as f:
+                    f.seek(snapshot['journal_size'])
+                    tail = f.read()
+                with open(self._journal_file, 'w') as f:
+                    f.write(tail)
+
+    def save(self) -> None:
+        """Take a snapshot and write it; blocks on the write lock, so run it off the event loop"""
+        self.write(self.snapshot())
+
+    def index_kind(self) -> str:
+        return "hnsw" if self.graph is not None else "exact"
+
+    def disk_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+
+class LocalVectorStore(BaseVectorStore):
+    """Vector store kept entirely in this process, with no database behind it.
+
+    Each collection generation is a directory under ``vector_index`` with a
+    memory-mapped vector file, the document records and, for large
+    collections, an HNSW graph. Searches, filters and hybrid ranking behave
+    like ChromaStore's, so the two can be compared on identical data.
+    """
+
+    backend = "local"
+
+    def __init__(self, collection_name: str = "customer_support_docs", embedding_generator: Optional[EmbeddingGenerator] = None, generation: Optional[int] = None):
+        self.index_mode = os.getenv("LOCAL_INDEX", "auto").lower()
+        self.hnsw_min_rows = int(os.getenv("LOCAL_HNSW_MIN_VECTORS", "20000"))
+        self.hnsw_params = {
+            'm': int(os.getenv("LOCAL_HNSW_M", "16")),
+            'ef_construction': int(os.getenv("LOCAL_HNSW_EF_CONSTRUCTION", "64")),
+            'ef_search': int(os.getenv("LOCAL_HNSW_EF_SEARCH", "64"))
+        }
+        super().__init__(collection_name, embedding_generator, os.path.join(os.getcwd(), "vector_index"), generation)
+
+    def _open_collection(self, name: str) -> LocalCollection:
+        """Load a collection directory, creating it if needed"""
+        path = os.path.join(self.data_path, name)
+        existed = os.path.exists(path)
+        collection = LocalCollection(path, name, self.index_mode, self.hnsw_min_rows, **self.hnsw_params)
+        if existed:
+            print(f"Loaded existing local collection: {name} ({collection.count()} documents, {collection.index_kind()} index)")
+        else:
+            print(f"Created new local collection: {name}")
+        return collection
+
+    def _collection_names(self) -> List[str]:
+        return [
+            name for name in os.listdir(self.data_path)
+            if name != "lexical" and os.path.isdir(os.path.join(self.data_path, name))
+        ]
+
+    def _delete_collection(self, name: str) -> None:
+        shutil.rmtree(os.path.join(self.data_path, name), ignore_errors=True)
+
+    def _collection_count(self, collection: LocalCollection) -> int:
+        return collection.count()
+
+    def _collection_pages(self, collection: LocalCollection) -> Iterator[Tuple[List[str], List[str]]]:
+        return collection.pages()
+
+    async def add_documents(self, ids: List[str], embeddings: Sequence[Sequence[float]], texts: List[str], metadatas: List[Dict[str, Any]], batch_size: Optional[int] = None, term_counts: Optional[List[Dict[str, int]]] = None) -> None:
+        """Upsert documents; writing the same ID again replaces the document"""
+        try:
+            if term_counts is None:
+                term_counts = count_terms(texts)
+            await run_io(self.collection.upsert, ids, np.asarray(embeddings, dtype=np.float32), texts, metadatas)
+            self.lexical_index.add(ids, term_counts)
+            self.content_version += 1
+        except Exception as e:
+            print(f"Error adding documents to local store: {e}")
+            raise
+
+    async def search_many(self, vectors: Sequence[Sequence[float]], top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """Search several query vectors in one pass over the collection"""
+        if len(vectors) == 0:
+            return []
+        try:
+            return await run_io(self._read_collection().query, np.asarray(vectors, dtype=np.float32), top_k, where)
+        except Exception as e:
+            print(f"Error searching local store: {e}")
+            return [[] for _ in vectors]
+
+    async def _get_with_distance(self, ids: List[str], embedding: Sequence[float], where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await run_io(self._read_collection().get_with_distance, ids, embedding, where)
+
+    async def persist(self) -> None:
+        """Save the lexical index and fold the record journal into a snapshot"""
+        await super().persist()
+        # Copying the records and graph takes the write lock, so it happens off the event loop too
+        await run_io(self.collection.save)
+
+    async def get_document_count(self) -> int:
+        """Get total number of documents in the collection"""
+        return self._read_collection().count()
+
+    def clear_collection(self) -> None:
+        """Clear all documents from the collection"""
+        self.collection.clear()
+        self.lexical_index.clear()
+        self.content_version += 1
+        print(f"Cleared local collection: {self.collection.name}")
+
+    async def delete_document(self, doc_id: str) -> bool:
+        """Delete a specific document"""
+        try:
+            await run_io(self.collection.delete, [doc_id])
+            self.lexical_index.remove([doc_id])
+            self.content_version += 1
+            return True
+        except Exception as e:
+            print(f"Error deleting document: {e}")
+            return False
+
+    async def delete_by_source(self, filename: str) -> int:
+        """Delete every chunk of a source file, returning how many were removed"""
+        ids = await run_io(self.collection.ids_where, {"filename": filename})
+        if ids:
+            await run_io(self.collection.delete, ids)
+            self.lexical_index.remove(ids)
+            self.content_version += 1
+        return len(ids)
+
+    async def get_all_documents(self) -> List[Dict[str, Any]]:
+        """Get all documents from the collection"""
+        return await run_io(self._read_collection().get_all)
+
+    def get_collection_info(self) -> Dict[str, Any]:
+        """Get information about the collection"""
+        return {
+            'name': self.collection_name,
+            'collection': self.collection.name,
+            'generation': self.generation,
+            'document_count': self.collection.count(),
+            'path': self.data_path,
+            'backend': self.backend,
+            'index': self.collection.index_kind(),
+            'disk_bytes': self.collection.disk_bytes()
+        }